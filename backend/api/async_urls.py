@@ -0,0 +1,55 @@
+from django.urls import path
+
+from recipes.versions import INGREDIENTS, RECIPES, TAGS
+from .async_views import DETAIL_ACTIONS, LIST_ACTIONS, async_read_view
+from .views import IngredientViewset, RecipeViewSet, TagsViewSet
+
+urlpatterns = [
+    path(
+        'tags/',
+        async_read_view(
+            TagsViewSet.as_view(LIST_ACTIONS, basename='tags', detail=False),
+            version=TAGS
+        )
+    ),
+    path(
+        'tags/<int:pk>/',
+        async_read_view(
+            TagsViewSet.as_view(DETAIL_ACTIONS, basename='tags', detail=True),
+            version=TAGS
+        )
+    ),
+    path(
+        'ingredients/',
+        async_read_view(
+            IngredientViewset.as_view(
+                LIST_ACTIONS, basename='ingredients', detail=False),
+            version=INGREDIENTS
+        )
+    ),
+    path(
+        'ingredients/<int:pk>/',
+        async_read_view(
+            IngredientViewset.as_view(
+                DETAIL_ACTIONS, basename='ingredients', detail=True),
+            version=INGREDIENTS
+        )
+    ),
+    path(
+        'recipes/',
+        async_read_view(
+            RecipeViewSet.as_view(
+                LIST_ACTIONS, basename='recipes', detail=False),
+            cache_action='list'
+        )
+    ),
+    path(
+        'recipes/<int:pk>/',
+        async_read_view(
+            RecipeViewSet.as_view(
+                DETAIL_ACTIONS, basename='recipes', detail=True),
+            version=RECIPES,
+            cache_action='retrieve'
+        )
+    ),
+]
@@ -0,0 +1,85 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .cache import get_response_key, version_etag, version_last_modified
+
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+}
+
+
+def is_fast_path_request(request):
+    """
+    Быстрый путь доступен только анонимным GET-запросам за JSON:
+    токен проверяется через БД, а браузерный интерфейс DRF
+    рендерится шаблонами.
+    """
+    return (
+        request.method == 'GET'
+        and 'HTTP_AUTHORIZATION' not in request.META
+        and 'format' not in request.GET
+        and 'text/html' not in request.META.get('HTTP_ACCEPT', '')
+    )
+
+
+def get_fast_response(request, kwargs, version=None, cache_action=None):
+    """
+    Отвечает без обращений к БД: 304 по версии данных
+    или сохраненными данными анонимного ответа.
+    Возвращает None, если запрос нужно передать представлению.
+    """
+    etag = last_modified = None
+    if version is not None:
+        etag = quote_etag(version_etag(version)(request))
+        last_modified = int(
+            version_last_modified(version)(request).timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+    if cache_action is None:
+        return None
+    data = cache.get(get_response_key(request, cache_action, kwargs))
+    if data is None:
+        return None
+    response = HttpResponse(
+        JSONRenderer().render(data), content_type='application/json')
+    response['Vary'] = 'Accept'
+    if etag is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def async_read_view(view, version=None, cache_action=None):
+    """
+    Асинхронная обертка над представлением DRF для ASGI.
+    Анонимные запросы сначала проверяются по ETag и кэшу ответов
+    в пуле потоков без привязки к соединению с БД. Обертка нужна
+    только маршрутам с таким быстрым путем: без него она лишь
+    добавляет переход между потоками.
+    Остальные запросы выполняет синхронное представление через
+    sync_to_async(thread_sensitive=True): ORM и соединение с БД
+    остаются в потоке, закрепленном за запросом в foodgram.asgi.
+    """
+    run_view = sync_to_async(view, thread_sensitive=True)
+    fast_response = sync_to_async(get_fast_response, thread_sensitive=False)
+
+    async def async_view(request, *args, **kwargs):
+        if is_fast_path_request(request):
+            response = await fast_response(
+                request, kwargs, version, cache_action)
+            if response is not None:
+                return response
+        return await run_view(request, *args, **kwargs)
+
+    async_view.csrf_exempt = True
+    return async_view
@@ -0,0 +1,46 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+TOKEN_CREDENTIALS_KEY = 'auth:token:{}'
+
+
+def get_credentials_key(token_key):
+    """Ключ кэша строится по хэшу, чтобы токены не хранились в именах."""
+    return TOKEN_CREDENTIALS_KEY.format(
+        hashlib.sha256(token_key.encode()).hexdigest())
+
+
+def invalidate_token(token_key):
+    cache.delete(get_credentials_key(token_key))
+
+
+def invalidate_user_tokens(user):
+    cache.delete_many([
+        get_credentials_key(token_key)
+        for token_key in Token.objects.filter(
+            user=user).values_list('key', flat=True)
+    ])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену с кэшированием пары пользователь-токен
+    на TOKEN_CACHE_TIMEOUT секунд вместо запроса к БД на каждый вызов.
+    Запись сбрасывается при удалении токена (logout djoser),
+    смене пароля и деактивации пользователя. Остальные изменения
+    пользователя, например прав персонала, вступают в силу
+    не позже чем через TOKEN_CACHE_TIMEOUT.
+    Неверные токены не кэшируются.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = get_credentials_key(key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials, settings.TOKEN_CACHE_TIMEOUT)
+        return credentials
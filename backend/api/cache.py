@@ -0,0 +1,111 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from recipes.versions import RECIPES, get_version
+from .replicas import replica_may_lag
+
+RECIPES_RESPONSE_KEY = 'recipes:response:{}:{}:{}'
+
+
+def get_response_key(request, action, kwargs):
+    """
+    Строит ключ по действию, хосту и нормализованным параметрам.
+    Принимает и запрос DRF, и HttpRequest асинхронных представлений.
+    """
+    params = sorted(
+        (key, sorted(values))
+        for key, values in request.GET.lists()
+        if any(values)
+    )
+    digest = hashlib.md5(
+        repr((request.get_host(), sorted(kwargs.items()), params)).encode()
+    ).hexdigest()
+    return RECIPES_RESPONSE_KEY.format(get_version(RECIPES), action, digest)
+
+
+def cache_anonymous_response(action):
+    """
+    Кэширует данные ответа для анонимных пользователей.
+    Ключ включает версию рецептов, поэтому при изменении рецептов
+    старые ответы просто перестают использоваться без перебора ключей.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return view_method(self, request, *args, **kwargs)
+            key = get_response_key(request, action, kwargs)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200 and not replica_may_lag(RECIPES):
+                cache.set(key, response.data, settings.RECIPES_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def get_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def version_etag(name):
+    """
+    Строит ETag из версии данных, пути запроса и заголовка Accept.
+    Проверка не требует запросов к БД: версия берется из кэша.
+    """
+    def etag_func(request, *args, **kwargs):
+        return get_etag(
+            get_version(name),
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT')
+        )
+    return etag_func
+
+
+def version_last_modified(name):
+    """Возвращает время последнего изменения данных по их версии."""
+    def last_modified_func(request, *args, **kwargs):
+        return datetime.fromtimestamp(
+            get_version(name) / 10 ** 9, tz=timezone.utc)
+    return last_modified_func
+
+
+def recipe_etag(request, *args, **kwargs):
+    """
+    ETag рецепта для анонимных пользователей зависит только от версии
+    рецептов. Для авторизованных его строит представление по флагам
+    уже загруженного рецепта, см. user_recipe_etag.
+    """
+    if request.user.is_authenticated:
+        return None
+    return version_etag(RECIPES)(request)
+
+
+def user_recipe_etag(request, recipe):
+    """
+    ETag рецепта для авторизованного пользователя: к версии рецептов
+    добавляются флаги избранного, списка покупок и подписки на автора
+    из аннотаций queryset, поэтому отдельного запроса не нужно.
+    """
+    return get_etag(
+        version_etag(RECIPES)(request),
+        request.user.pk,
+        (recipe.favorited, recipe.in_shopping_cart, recipe.subscribed)
+    )
+
+
+def recipe_last_modified(request, *args, **kwargs):
+    """
+    Last-Modified рецепта отдается только анонимным пользователям:
+    флаги текущего пользователя меняются без изменения версии рецептов.
+    """
+    if request.user.is_authenticated:
+        return None
+    return version_last_modified(RECIPES)(request)
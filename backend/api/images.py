@@ -0,0 +1,129 @@
+import io
+import os
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from recipes.versions import RECIPES, bump_version
+from .jobs import PENDING, get_executor, submit_job
+
+RENDITIONS_DIRECTORY = 'recipes/renditions'
+RENDITION_JOB_KEY = 'image_renditions_job:{}'
+RENDITION_JOB_TIMEOUT = 10 * 60
+
+THUMBNAIL = 'thumbnail'
+CARD = 'card'
+RENDITION_SIZES = {
+    THUMBNAIL: (240, 240),
+    CARD: (600, 600),
+}
+JPEG = 'jpeg'
+WEBP = 'webp'
+RENDITION_FORMATS = {
+    JPEG: 'JPEG',
+    WEBP: 'WEBP',
+}
+
+
+def to_rgb(image):
+    """Переводит изображение в RGB, заливая прозрачность белым цветом."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def save_image(image, image_format):
+    buffer = io.BytesIO()
+    image.save(
+        buffer,
+        RENDITION_FORMATS[image_format],
+        quality=settings.RECIPE_IMAGE_QUALITY,
+        optimize=True
+    )
+    return buffer.getvalue()
+
+
+def compress_image(image_file):
+    """
+    Пережимает загруженное изображение в JPEG.
+    Поворачивает его по EXIF, после чего метаданные не сохраняются,
+    и уменьшает до RECIPE_IMAGE_MAX_SIZE по большей стороне.
+    """
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        image = to_rgb(image)
+    max_size = settings.RECIPE_IMAGE_MAX_SIZE
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    return ContentFile(save_image(image, JPEG), name=f'{uuid4().hex}.jpg')
+
+
+def get_rendition_path(image_name, rendition, image_format):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{RENDITIONS_DIRECTORY}/{stem}_{rendition}.{image_format}'
+
+
+def get_rendition_url(recipe, rendition, image_format=JPEG):
+    """
+    Возвращает адрес уменьшенной копии изображения рецепта.
+    Пока копии не готовы, возвращается адрес исходного изображения.
+    """
+    if not recipe.image:
+        return None
+    if recipe.renditions_for != recipe.image.name:
+        return recipe.image.url
+    return default_storage.url(
+        get_rendition_path(recipe.image.name, rendition, image_format))
+
+
+def build_renditions(image_name):
+    """Строит все уменьшенные копии изображения в форматах JPEG и WebP."""
+    with default_storage.open(image_name) as image_file:
+        with Image.open(image_file) as image:
+            image = to_rgb(image)
+    for rendition, size in RENDITION_SIZES.items():
+        resized = ImageOps.fit(image, size, Image.LANCZOS)
+        for image_format in RENDITION_FORMATS:
+            path = get_rendition_path(image_name, rendition, image_format)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            default_storage.save(
+                path, ContentFile(save_image(resized, image_format)))
+
+
+def _run_renditions(recipe_id, image_name):
+    try:
+        build_renditions(image_name)
+        updated = Recipe.objects.filter(
+            pk=recipe_id, image=image_name
+        ).update(renditions_for=image_name)
+        if updated:
+            bump_version(RECIPES)
+    finally:
+        cache.delete(RENDITION_JOB_KEY.format(image_name))
+
+
+def enqueue_renditions(recipe):
+    """
+    После фиксации транзакции ставит построение копий изображения
+    в отдельный пул потоков. Повторная постановка того же
+    изображения, пока задача не завершилась, пропускается.
+    Ошибка построения, например битый файл, пишется в лог.
+    """
+    image_name = recipe.image.name
+    if not image_name or recipe.renditions_for == image_name:
+        return
+    if not cache.add(RENDITION_JOB_KEY.format(image_name), PENDING,
+                     RENDITION_JOB_TIMEOUT):
+        return
+    executor = get_executor(
+        'image-renditions', settings.IMAGE_RENDITION_WORKERS)
+    submit_job(executor, _run_renditions, recipe.pk, image_name)
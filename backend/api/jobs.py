@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, transaction
+
+from recipes.models import ShoppingListJob
+from .utils import JsonToPdf, get_shopping_list, get_shopping_list_recipes
+
+PENDING = ShoppingListJob.PENDING
+DONE = ShoppingListJob.DONE
+FAILED = ShoppingListJob.FAILED
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_executor(name='shopping-list-pdf',
+                 max_workers=settings.SHOPPING_LIST_PDF_WORKERS):
+    """Лениво создает именованный пул потоков для фоновых задач."""
+    with _executor_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix=name
+            )
+    return _executors[name]
+
+
+def run_pool_job(job, *args):
+    """
+    Выполняет задачу в потоке пула. Соединения потока с БД
+    проверяются до и после задачи, как в начале и конце запроса,
+    поэтому после перезапуска БД следующие задачи не падают.
+    Future никто не проверяет, поэтому ошибка пишется в лог.
+    """
+    close_old_connections()
+    try:
+        return job(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой.',
+                         job.__name__)
+    finally:
+        close_old_connections()
+
+
+def submit_job(executor, job, *args):
+    """Ставит задачу в пул после фиксации текущей транзакции."""
+    transaction.on_commit(
+        lambda: executor.submit(run_pool_job, job, *args))
+
+
+def get_pdf_storage():
+    """
+    Хранилище готовых PDF вне MEDIA_ROOT: файлы отдаются только
+    через API владельцу корзины.
+    """
+    return FileSystemStorage(location=settings.SHOPPING_LIST_PDF_ROOT)
+
+
+def get_pdf_path(job):
+    return f'{job.user_id}/{job.content_hash}.pdf'
+
+
+def get_cart_snapshot(user):
+    """
+    Возвращает хеш содержимого корзины вместе с данными для PDF.
+    Хеш считается по суммированным ингредиентам и названиям рецептов,
+    поэтому одинаковое содержимое корзины дает один и тот же файл.
+    """
+    recipe_names = sorted(get_shopping_list_recipes(user))
+    ingredients = list(get_shopping_list(user))
+    content = json.dumps(
+        [recipe_names, ingredients], ensure_ascii=False, sort_keys=True)
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    return content_hash, recipe_names, ingredients
+
+
+def delete_stale_pdfs(user, content_hash):
+    """
+    Удаляет PDF пользователя для прежнего содержимого корзины.
+    Файлы других пользователей не затрагиваются: у каждого свои.
+    """
+    stale = list(ShoppingListJob.objects.filter(
+        user=user).exclude(content_hash=content_hash))
+    if not stale:
+        return
+    storage = get_pdf_storage()
+    for job in stale:
+        storage.delete(get_pdf_path(job))
+    ShoppingListJob.objects.filter(pk__in=[job.pk for job in stale]).delete()
+
+
+def render_pdf(job, recipe_names, ingredients):
+    """Формирует PDF и сохраняет его в хранилище под хешем корзины."""
+    pdf_bytes = JsonToPdf().json_transformer(recipe_names, ingredients)
+    storage = get_pdf_storage()
+    path = get_pdf_path(job)
+    if not storage.exists(path):
+        storage.save(path, ContentFile(pdf_bytes))
+    return pdf_bytes
+
+
+def read_pdf(job):
+    """Возвращает содержимое готового PDF или None, если файла нет."""
+    storage = get_pdf_storage()
+    path = get_pdf_path(job)
+    if job.status != DONE or not storage.exists(path):
+        return None
+    with storage.open(path) as pdf_file:
+        return pdf_file.read()
+
+
+def get_or_render_pdf(user):
+    """Отдает готовый PDF из хранилища или формирует его синхронно."""
+    content_hash, recipe_names, ingredients = get_cart_snapshot(user)
+    delete_stale_pdfs(user, content_hash)
+    job, _ = ShoppingListJob.objects.get_or_create(
+        user=user, content_hash=content_hash)
+    pdf_bytes = read_pdf(job)
+    if pdf_bytes is not None:
+        return pdf_bytes
+    pdf_bytes = render_pdf(job, recipe_names, ingredients)
+    ShoppingListJob.objects.filter(pk=job.pk).update(status=DONE)
+    return pdf_bytes
+
+
+def run_job(job, recipe_names, ingredients):
+    """
+    Выполняется в пуле потоков. Если пока шла генерация корзина
+    изменилась и задачу удалили, сохраненный файл тоже удаляется.
+    При ошибке задача помечается FAILED, чтобы клиент не ждал ее.
+    """
+    try:
+        render_pdf(job, recipe_names, ingredients)
+    except Exception:
+        ShoppingListJob.objects.filter(pk=job.pk).update(status=FAILED)
+        raise
+    if not ShoppingListJob.objects.filter(pk=job.pk).update(status=DONE):
+        get_pdf_storage().delete(get_pdf_path(job))
+
+
+def enqueue_pdf(user):
+    """
+    Ставит генерацию PDF в очередь пула потоков и возвращает задачу.
+    Состояние задачи хранится в БД, поэтому его видят все процессы.
+    Если файл для такого содержимого корзины уже есть
+    или уже формируется, новая генерация не запускается.
+    """
+    content_hash, recipe_names, ingredients = get_cart_snapshot(user)
+    delete_stale_pdfs(user, content_hash)
+    job, created = ShoppingListJob.objects.get_or_create(
+        user=user, content_hash=content_hash)
+    if not created and job.status != FAILED:
+        if job.status == PENDING or read_pdf(job) is not None:
+            return job
+    if not created:
+        job.status = PENDING
+        job.save(update_fields=['status'])
+    submit_job(get_executor(), run_job, job, recipe_names, ingredients)
+    return job
+
+
+def get_job(user, job_id):
+    """Возвращает задачу пользователя или None для чужих и неизвестных."""
+    return ShoppingListJob.objects.filter(
+        user=user, content_hash=job_id).first()
@@ -0,0 +1,377 @@
+import base64
+import io
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, setup_test_environment, teardown_test_environment
+)
+from django.urls import URLPattern, URLResolver, reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import urls
+from api.jobs import DONE, get_or_render_pdf
+from api.management.commands.seed_bench import BENCH_PREFIX, PASSWORD
+from api.transfer import recipe_to_dict
+from recipes.models import Product, Recipe, Tag
+
+User = get_user_model()
+
+
+class Scenario:
+    """Замеряемый запрос с подготовкой и уборкой вне замера."""
+
+    def __init__(self, request, setup=None, cleanup=None):
+        self.request = request
+        self.setup = setup
+        self.cleanup = cleanup
+
+    def prepare(self):
+        state = {}
+        if self.setup is not None:
+            self.setup(state)
+        return state
+
+    def finish(self, state, response):
+        state['response'] = response
+        if self.cleanup is not None:
+            self.cleanup(state)
+
+    def run(self):
+        state = self.prepare()
+        response = self.request(state)
+        self.finish(state, response)
+        return response
+
+
+def get_route_names(patterns):
+    """Собирает имена всех маршрутов api/urls.py, включая вложенные."""
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= get_route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def check_status(name, response):
+    """Сценарий с ошибкой не замеряется: его цифры ничего не значат."""
+    if not 200 <= response.status_code < 400:
+        raise CommandError(
+            f'Сценарий {name} вернул статус {response.status_code}.')
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+class Command(BaseCommand):
+    """
+    Прогоняет все маршруты API внутри процесса и сохраняет p50/p95
+    задержки, число запросов к БД и пиковую память в JSON.
+    Пиковая память меряется отдельным прогоном под tracemalloc,
+    чтобы он не искажал задержки. Пишущие сценарии возвращают
+    данные в исходное состояние, но команду лучше запускать на БД,
+    заполненной seed_bench, а не на рабочей. Сценарий, вернувший
+    статус вне 2xx и 3xx, останавливает прогон.
+    """
+
+    help = 'Бенчмарк всех эндпоинтов API с выводом в JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--output', default='bench_api.json')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего прогона для сравнения.')
+        parser.add_argument(
+            '--only', nargs='+', help='Имена маршрутов для прогона.')
+
+    def handle(self, *args, **options):
+        self.prepare()
+        scenarios = self.get_scenarios()
+        missing = get_route_names(urls.urlpatterns) - set(scenarios)
+        if missing:
+            raise CommandError(
+                f'Нет сценариев для маршрутов: {sorted(missing)}.')
+        names = options['only'] or sorted(scenarios)
+        setup_test_environment()
+        try:
+            results = {
+                name: self.measure(
+                    name, scenarios[name], options['repeat'])
+                for name in names
+            }
+        finally:
+            teardown_test_environment()
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'recipes': Recipe.objects.count(),
+            'users': User.objects.count(),
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as compare:
+                previous = json.load(compare)['results']
+        for name, result in results.items():
+            line = (
+                f'{name:32} {result["status"]:>3} '
+                f'p50 {result["p50_ms"]:8.2f} мс  '
+                f'p95 {result["p95_ms"]:8.2f} мс  '
+                f'запросов {result["queries"]:>3}  '
+                f'память {result["peak_kb"]:8.1f} КБ'
+            )
+            if name in previous:
+                before = previous[name]
+                line += (
+                    f'  (p50 было {before["p50_ms"]:.2f} мс, '
+                    f'запросов было {before["queries"]})'
+                )
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}.'))
+
+    def prepare(self):
+        """
+        Выбирает пользователя из созданных seed_bench: сценарии меняют
+        его пароль и переключают его подписки, избранное и корзину.
+        Для выгрузки и импорта создается сотрудник BENCH_PREFIX-staff.
+        """
+        self.user = User.objects.filter(
+            username__startswith=BENCH_PREFIX, recipes__isnull=False,
+            is_active=True
+        ).first()
+        self.recipe = Recipe.objects.exclude(author=self.user).exclude(
+            author__user__follower=self.user).exclude(
+            is_favorited__author=self.user).exclude(
+            is_in_shopping_cart__author=self.user).first()
+        self.own_recipe = Recipe.objects.filter(author=self.user).first()
+        self.tag = Tag.objects.first()
+        self.product = Product.objects.first()
+        if None in (self.user, self.recipe, self.own_recipe, self.tag,
+                    self.product):
+            raise CommandError(
+                'Недостаточно данных, сначала выполните seed_bench.')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.anonymous = APIClient()
+        staff, _ = User.objects.update_or_create(
+            username=f'{BENCH_PREFIX}staff',
+            defaults={
+                'email': f'{BENCH_PREFIX}staff@example.com',
+                'first_name': 'Bench',
+                'last_name': 'Staff',
+                'is_staff': True,
+                'is_active': True,
+            }
+        )
+        self.staff = APIClient()
+        self.staff.force_authenticate(staff)
+        self.numbers = count()
+        image = io.BytesIO()
+        Image.new('RGB', (64, 64), 'white').save(image, 'PNG')
+        self.image = 'data:image/png;base64,' + base64.b64encode(
+            image.getvalue()).decode()
+
+    def recipe_data(self, name=None):
+        return {
+            'name': name or f'Бенч {next(self.numbers)}',
+            'text': 'Рецепт для бенчмарка.',
+            'cooking_time': 10,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.product.pk, 'amount': 10}],
+            'image': self.image,
+        }
+
+    def import_line(self, name):
+        """Строка NDJSON с рецептом пользователя под новым именем."""
+        data = recipe_to_dict(self.own_recipe)
+        data['name'] = name
+        return json.dumps(data, ensure_ascii=False).encode()
+
+    def get_scenarios(self):
+        """
+        Сценарий состоит из замеряемого запроса и необязательной
+        подготовки и уборки, которые в замер не входят.
+        Уборка возвращает данные в исходное состояние.
+        """
+        client = self.client
+        anonymous = self.anonymous
+        recipe = self.recipe.pk
+        author = self.recipe.author_id
+
+        def get(path, client=client, **params):
+            return Scenario(lambda state: read(client.get(path, params)))
+
+        def toggle(path):
+            return Scenario(
+                lambda state: client.post(path),
+                cleanup=lambda state: client.delete(path)
+            )
+
+        def restore_password(state):
+            self.user.set_password(PASSWORD)
+            self.user.save(update_fields=['password'])
+
+        def delete_created(model):
+            return lambda state: model.objects.filter(
+                pk=state['response'].data.get('id')).delete()
+
+        def new_user(state):
+            number = f'{next(self.numbers)}-{time.time_ns()}'
+            return anonymous.post(reverse('user-list-create'), {
+                'email': f'bench-new-{number}@example.com',
+                'username': f'bench-new-{number}',
+                'first_name': 'Bench',
+                'last_name': 'New',
+                'password': PASSWORD,
+            })
+
+        def new_import(state):
+            state['name'] = f'Импорт {next(self.numbers)}'
+            state['line'] = self.import_line(state['name'])
+
+        def delete_imported(state):
+            Recipe.objects.filter(
+                author=self.user, name=state['name']).delete()
+            report = state['response'].data
+            if report['created'] != 1:
+                raise CommandError(
+                    f'Импорт не создал рецепт: {report["errors"]}.')
+
+        def render_job(state):
+            get_or_render_pdf(self.user)
+            state['job'] = self.user.shopping_list_jobs.filter(
+                status=DONE).values_list('content_hash', flat=True).first()
+
+        def create_token(state):
+            token, _ = Token.objects.get_or_create(user=self.user)
+            state['client'] = APIClient()
+            state['client'].credentials(
+                HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        def read(response):
+            """Дочитывает потоковый ответ, чтобы он попал в замер."""
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response
+
+        return {
+            'api-root': get('/api/'),
+            'user-list-create': Scenario(
+                new_user, cleanup=delete_created(User)),
+            'user-detail': get(reverse('user-detail', args=[author])),
+            'follow-list-create': toggle(
+                reverse('follow-list-create', args=[author])),
+            'subscriptions': get(reverse('subscriptions'), recipes_limit=3),
+            'set-password': Scenario(
+                lambda state: client.post(reverse('set-password'), {
+                    'current_password': PASSWORD,
+                    'new_password': PASSWORD + '-new',
+                }),
+                cleanup=restore_password
+            ),
+            'favorite-recipes': toggle(
+                reverse('favorite-recipes', args=[recipe])),
+            'retrieve-delete-shopping-list': toggle(
+                reverse('retrieve-delete-shopping-list', args=[recipe])),
+            'get-shopping-cart': get(
+                reverse('get-shopping-cart'), format='txt'),
+            'shopping-cart-preview': get(reverse('shopping-cart-preview')),
+            'shopping-cart-jobs': Scenario(
+                lambda state: client.post(reverse('shopping-cart-jobs'))),
+            'shopping-cart-job-detail': Scenario(
+                lambda state: client.get(reverse(
+                    'shopping-cart-job-detail', args=[state['job']])),
+                setup=render_job
+            ),
+            'recipes-export': Scenario(lambda state: read(
+                self.staff.get(reverse('recipes-export')))),
+            'recipes-import': Scenario(
+                lambda state: self.staff.post(
+                    reverse('recipes-import'), state['line'],
+                    content_type='application/x-ndjson'),
+                setup=new_import,
+                cleanup=delete_imported
+            ),
+            'login': Scenario(lambda state: anonymous.post(reverse('login'), {
+                'email': self.user.email, 'password': PASSWORD})),
+            'logout': Scenario(
+                lambda state: state['client'].post(reverse('logout')),
+                setup=create_token
+            ),
+            'tags-list': get(reverse('tags-list')),
+            'tags-detail': get(reverse('tags-detail', args=[self.tag.pk])),
+            'ingredients-list': get(reverse('ingredients-list'), name='Про'),
+            'ingredients-detail': get(
+                reverse('ingredients-detail', args=[self.product.pk])),
+            'recipes-list': get(reverse('recipes-list'), client=anonymous),
+            'recipes-list-authenticated': get(reverse('recipes-list')),
+            'recipes-search': get(reverse('recipes-list'), search='рецепт'),
+            'recipes-detail': get(reverse('recipes-detail', args=[recipe])),
+            'recipes-create': Scenario(
+                lambda state: client.post(
+                    reverse('recipes-list'), self.recipe_data(),
+                    format='json'),
+                cleanup=delete_created(Recipe)
+            ),
+            'recipes-update': Scenario(lambda state: client.patch(
+                reverse('recipes-detail', args=[self.own_recipe.pk]),
+                self.recipe_data(self.own_recipe.name),
+                format='json'
+            )),
+            'recipes-delete': Scenario(
+                lambda state: client.delete(
+                    reverse('recipes-detail', args=[state['recipe'].pk])),
+                setup=lambda state: state.update(
+                    recipe=Recipe.objects.create(
+                        author=self.user, name=f'Бенч {next(self.numbers)}',
+                        text='Рецепт для бенчмарка.', cooking_time=10,
+                        image=self.own_recipe.image.name
+                    )
+                )
+            ),
+        }
+
+    def measure(self, name, scenario, repeat):
+        latencies = []
+        queries = []
+        check_status(name, scenario.run())
+        for _ in range(repeat):
+            state = scenario.prepare()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = scenario.request(state)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context))
+            scenario.finish(state, response)
+            check_status(name, response)
+        state = scenario.prepare()
+        tracemalloc.start()
+        response = scenario.request(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        scenario.finish(state, response)
+        return {
+            'status': response.status_code,
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'queries': max(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
@@ -0,0 +1,317 @@
+import asyncio
+import json
+import multiprocessing
+import resource
+import statistics
+import time
+import traceback
+from datetime import datetime, timezone
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment
+)
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.bench_api import percentile
+from api.management.commands.seed_bench import BENCH_PREFIX
+from recipes.models import Product, Recipe, Tag
+
+ASGI_URLCONF = 'foodgram.urls_asgi'
+SYNC = 'sync'
+ASYNC = 'async'
+
+
+def add_db_latency(latency):
+    """
+    Имитирует сетевую задержку до БД: при локальной SQLite
+    запросы почти мгновенны и ожидание ввода-вывода не видно.
+    """
+    def execute_wrapper(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def install(connection):
+        if execute_wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(execute_wrapper)
+
+    connection_created.connect(
+        lambda sender, connection, **kwargs: install(connection), weak=False)
+    for db_connection in connections.all():
+        install(db_connection)
+
+
+def get_wsgi_environ(url, headers):
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'testserver',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': BytesIO(),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def get_asgi_scope(url, headers):
+    parts = urlsplit(url)
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver')] + [
+            (name.lower().encode(), value.encode())
+            for name, value in headers.items()
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+
+
+def call_wsgi(application, url, headers):
+    statuses = []
+    body = application(
+        get_wsgi_environ(url, headers),
+        lambda status, response_headers, exc_info=None: statuses.append(
+            int(status.split()[0]))
+    )
+    try:
+        b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return statuses[0]
+
+
+async def call_asgi(application, url, headers):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(get_asgi_scope(url, headers), receive, send)
+    return messages[0]['status']
+
+
+def summarize(latencies, statuses, elapsed):
+    return {
+        'requests': len(latencies),
+        'elapsed': elapsed,
+        'latencies': latencies,
+        'errors': sum(status >= 400 for status in statuses),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_sync_worker(urls, requests, headers):
+    """Синхронный воркер, как у gunicorn: один запрос за раз."""
+    application = WSGIHandler()
+    for url in urls:
+        call_wsgi(application, url, headers)
+    latencies = []
+    statuses = []
+    started = time.perf_counter()
+    for number in range(requests):
+        request_started = time.perf_counter()
+        statuses.append(
+            call_wsgi(application, urls[number % len(urls)], headers))
+        latencies.append((time.perf_counter() - request_started) * 1000)
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+def run_async_worker(urls, requests, headers, concurrency):
+    """Асинхронный воркер: concurrency запросов одновременно."""
+    with override_settings(ROOT_URLCONF=ASGI_URLCONF):
+        from foodgram.asgi import application
+
+        async def run():
+            for url in urls:
+                await call_asgi(application, url, headers)
+            numbers = iter(range(requests))
+            latencies = []
+            statuses = []
+
+            async def client():
+                for number in numbers:
+                    request_started = time.perf_counter()
+                    statuses.append(await call_asgi(
+                        application, urls[number % len(urls)], headers))
+                    latencies.append(
+                        (time.perf_counter() - request_started) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*[client() for _ in range(concurrency)])
+            return summarize(
+                latencies, statuses, time.perf_counter() - started)
+
+        return asyncio.run(run())
+
+
+def run_worker(mode, options, urls, headers, results):
+    """Выполняется в дочернем процессе, ошибки передаются родителю."""
+    connections.close_all()
+    try:
+        if options['db_latency_ms']:
+            add_db_latency(options['db_latency_ms'] / 1000)
+        if mode == SYNC:
+            result = run_sync_worker(urls, options['requests'], headers)
+        else:
+            result = run_async_worker(
+                urls, options['requests'], headers, options['concurrency'])
+    except Exception:
+        result = {'error': traceback.format_exc()}
+    finally:
+        connections.close_all()
+    results.put(result)
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает пропускную способность синхронного развертывания
+    (WSGI, воркеры gunicorn по одному запросу) и асинхронного
+    (foodgram.asgi с асинхронными представлениями api.async_urls)
+    при равной памяти: оба режима запускают одинаковое число
+    процессов, а их суммарный пиковый RSS выводится рядом с req/s.
+    Процессы создаются через fork, поэтому команда работает на Linux.
+    """
+
+    help = 'Сравнивает req/s синхронного и асинхронного развертывания.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Число запросов на процесс.')
+        parser.add_argument(
+            '--db-latency-ms', type=float, default=0,
+            help='Искусственная задержка каждого запроса к БД.')
+        parser.add_argument(
+            '--authenticated', action='store_true',
+            help='Запросы с токеном пользователя из seed_bench.')
+        parser.add_argument('--output', default='bench_asgi.json')
+
+    def get_urls(self):
+        recipe = Recipe.objects.order_by('pk').first()
+        tag = Tag.objects.order_by('pk').first()
+        product = Product.objects.order_by('pk').first()
+        if None in (recipe, tag, product):
+            raise CommandError(
+                'Недостаточно данных, сначала выполните seed_bench.')
+        return [
+            reverse('recipes-list'),
+            reverse('recipes-detail', args=[recipe.pk]),
+            reverse('tags-list'),
+            reverse('ingredients-list') + '?' + urlencode(
+                {'name': product.name[:3]}),
+            reverse('user-detail', args=[recipe.author_id]),
+        ]
+
+    def get_headers(self, authenticated):
+        headers = {'Accept': 'application/json'}
+        if authenticated:
+            token, _ = Token.objects.get_or_create(
+                user=Recipe.objects.filter(
+                    author__username__startswith=BENCH_PREFIX
+                ).first().author
+            )
+            headers['Authorization'] = f'Token {token.key}'
+        return headers
+
+    def run_mode(self, mode, options, urls, headers):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        connections.close_all()
+        workers = [
+            context.Process(
+                target=run_worker,
+                args=(mode, options, urls, headers, results)
+            )
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        worker_results = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        for result in worker_results:
+            if 'error' in result:
+                raise CommandError(result['error'])
+        latencies = [
+            latency
+            for result in worker_results for latency in result['latencies']
+        ]
+        requests = sum(result['requests'] for result in worker_results)
+        elapsed = max(result['elapsed'] for result in worker_results)
+        rss_mb = sum(
+            result['max_rss_kb'] for result in worker_results) / 1024
+        return {
+            'requests': requests,
+            'errors': sum(result['errors'] for result in worker_results),
+            'rps': round(requests / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'rss_mb': round(rss_mb, 1),
+            'rps_per_mb': round(requests / elapsed / rss_mb, 2),
+        }
+
+    def handle(self, *args, **options):
+        urls = self.get_urls()
+        headers = self.get_headers(options['authenticated'])
+        setup_test_environment()
+        try:
+            results = {
+                mode: self.run_mode(mode, options, urls, headers)
+                for mode in (SYNC, ASYNC)
+            }
+        finally:
+            teardown_test_environment()
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'processes': options['processes'],
+            'concurrency': options['concurrency'],
+            'db_latency_ms': options['db_latency_ms'],
+            'authenticated': options['authenticated'],
+            'urls': urls,
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode:6} {result["rps"]:9.1f} req/s  '
+                f'p50 {result["p50_ms"]:8.2f} мс  '
+                f'p95 {result["p95_ms"]:8.2f} мс  '
+                f'RSS {result["rss_mb"]:7.1f} МБ  '
+                f'ошибок {result["errors"]}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}.'))
@@ -0,0 +1,40 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from api.search import IngredientIndex
+from recipes.models import Product
+
+
+class Command(BaseCommand):
+    """Сравнивает поиск ингредиентов по индексу с фильтром ILIKE."""
+
+    help = 'Микробенчмарк поиска ингредиентов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*',
+                            default=['с', 'мол', 'сыр', 'ко', 'рис'])
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=50)
+
+    def handle(self, *args, **options):
+        index = IngredientIndex()
+        index.search('')
+        repeat = options['repeat']
+        limit = options['limit']
+        for query in options['queries']:
+            orm_time = timeit.timeit(
+                lambda: list(
+                    Product.objects.filter(name__icontains=query)[:limit]
+                ),
+                number=repeat
+            )
+            index_time = timeit.timeit(
+                lambda: index.search(query, limit=limit),
+                number=repeat
+            )
+            self.stdout.write(
+                f'{query!r}: ILIKE {orm_time / repeat * 1000:.3f} мс, '
+                f'индекс {index_time / repeat * 1000:.3f} мс, '
+                f'ускорение x{orm_time / index_time:.1f}'
+            )
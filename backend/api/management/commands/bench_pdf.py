@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils import JsonToPdf
+
+
+class Command(BaseCommand):
+    """Измеряет пропускную способность генерации PDF со списком покупок."""
+
+    help = 'Бенчмарк генерации PDF (документов в секунду от размера корзины).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1, 10, 40, 100])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        for size in options['sizes']:
+            recipe_names = [f'Рецепт {number}' for number in range(size)]
+            ingredients = [
+                {
+                    'name': f'Продукт {number}',
+                    'measurement_unit': 'г',
+                    'total_amount': number * 10
+                }
+                for number in range(size * 5)
+            ]
+            started = time.perf_counter()
+            for _ in range(repeat):
+                JsonToPdf().json_transformer(recipe_names, ingredients)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{size} рецептов: {repeat / elapsed:.1f} PDF/с, '
+                f'{elapsed / repeat * 1000:.1f} мс на документ'
+            )
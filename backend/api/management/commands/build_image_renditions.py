@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.images import build_renditions
+from recipes.models import Recipe
+from recipes.versions import RECIPES, bump_version
+
+
+class Command(BaseCommand):
+    """
+    Строит уменьшенные копии изображений рецептов, для которых их еще нет,
+    например после обновления или потери файлов.
+    """
+
+    help = 'Строит уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить копии для всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.exclude(renditions_for=F('image'))
+        built = 0
+        for recipe_id, image_name in recipes.values_list('id', 'image'):
+            try:
+                build_renditions(image_name)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            Recipe.objects.filter(pk=recipe_id).update(
+                renditions_for=image_name)
+            built += 1
+        if built:
+            bump_version(RECIPES)
+        self.stdout.write(self.style.SUCCESS(
+            f'Построены копии изображений для рецептов: {built}.'))
@@ -0,0 +1,204 @@
+import os
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.images import build_renditions, compress_image
+from recipes.models import (
+    TAGS_MASK_SIZE, Favorite, IngredientToRecipe, Product, PurchaseList,
+    Recipe, Tag
+)
+from recipes.versions import INGREDIENTS, RECIPES, TAGS, bump_version
+from users.models import Follow
+
+User = get_user_model()
+
+SAMPLE_IMAGE = os.path.join(
+    settings.BASE_DIR, 'recipes', 'images', 'pozharskie-kotleti.jpg')
+PASSWORD = 'bench-password'
+BENCH_PREFIX = 'bench-'
+TAG_COLORS = ('#FF0000', '#FFA500', '#00FF00', '#800080', '#808080')
+
+
+def created_ids(model, objects, **filters):
+    """
+    Возвращает id созданных bulk_create строк. PostgreSQL возвращает их
+    сразу, на остальных СУБД строки дочитываются по фильтру.
+    """
+    if objects and objects[0].pk is not None:
+        return [obj.pk for obj in objects]
+    return list(model.objects.filter(**filters).order_by('pk').values_list(
+        'pk', flat=True))
+
+
+class Command(BaseCommand):
+    """
+    Заполняет БД синтетическими данными для бенчмарков.
+    Все строки, кроме тегов, создаются пачками через bulk_create,
+    счетчики и суммы списков покупок пересчитываются командами
+    recount_counters и rebuild_cart_items.
+    Пользователи получают общий пароль PASSWORD.
+    """
+
+    help = 'Создает пользователей, рецепты, подписки, избранное и корзины.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.run_id = uuid.uuid4().hex[:8]
+        started = time.perf_counter()
+        with transaction.atomic():
+            tags = self.seed_tags(options['tags'])
+            product_ids = self.seed_products(options['ingredients'])
+            user_ids = self.seed_users(options['users'])
+            recipe_ids = self.seed_recipes(
+                options['recipes'], user_ids, tags, product_ids,
+                options['ingredients_per_recipe'])
+            self.seed_pairs(
+                Follow, 'follower_id', 'author_id', user_ids, user_ids,
+                options['follows_per_user'], exclude_self=True)
+            self.seed_pairs(
+                Favorite, 'author_id', 'recipe_id', user_ids, recipe_ids,
+                options['favorites_per_user'])
+            self.seed_pairs(
+                PurchaseList, 'author_id', 'recipe_id', user_ids, recipe_ids,
+                options['carts_per_user'])
+            call_command('recount_counters', stdout=self.stdout)
+            call_command('rebuild_cart_items', stdout=self.stdout)
+        bump_version(RECIPES, TAGS, INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)} '
+            f'за {time.perf_counter() - started:.1f} с. '
+            f'Пароль пользователей: {PASSWORD}.'
+        ))
+
+    def seed_tags(self, count):
+        tags = list(Tag.objects.all())
+        count = min(count, TAGS_MASK_SIZE)
+        for number in range(len(tags), count):
+            tags.append(Tag.objects.create(
+                name=f'Тег {number}',
+                color=TAG_COLORS[number % len(TAG_COLORS)],
+                slug=f'bench-tag-{number}'
+            ))
+        return tags[:count]
+
+    def seed_products(self, count):
+        Product.objects.bulk_create(
+            [
+                Product(name=f'Продукт {number}', measurement_unit='г')
+                for number in range(count)
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+        return list(Product.objects.values_list('pk', flat=True)[:count])
+
+    def seed_users(self, count):
+        password = make_password(PASSWORD)
+        prefix = f'{BENCH_PREFIX}{self.run_id}'
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f'{prefix}-{number}',
+                    email=f'{prefix}-{number}@example.com',
+                    first_name='Bench',
+                    last_name=str(number),
+                    password=password
+                )
+                for number in range(count)
+            ],
+            batch_size=self.batch_size
+        )
+        return created_ids(User, users, username__startswith=prefix)
+
+    def get_image(self):
+        with open(SAMPLE_IMAGE, 'rb') as image_file:
+            image = compress_image(image_file)
+        name = default_storage.save(f'recipes/images/{image.name}', image)
+        build_renditions(name)
+        return name
+
+    def seed_recipes(self, count, user_ids, tags, product_ids,
+                     ingredients_per_recipe):
+        image = self.get_image()
+        recipe_tags = []
+        recipes = []
+        for number in range(count):
+            chosen = self.random.sample(
+                tags, self.random.randint(1, min(3, len(tags))))
+            recipe_tags.append(chosen)
+            mask = 0
+            for tag in chosen:
+                mask |= 1 << tag.bit
+            recipes.append(Recipe(
+                author_id=self.random.choice(user_ids),
+                name=f'Рецепт {number}',
+                text=f'Описание рецепта {number} для бенчмарка.',
+                cooking_time=self.random.randint(5, 180),
+                image=image,
+                renditions_for=image,
+                tags_mask=mask
+            ))
+        recipes = Recipe.objects.bulk_create(
+            recipes, batch_size=self.batch_size)
+        recipe_ids = created_ids(Recipe, recipes, author_id__in=user_ids)
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.pk)
+                for recipe_id, chosen in zip(recipe_ids, recipe_tags)
+                for tag in chosen
+            ],
+            batch_size=self.batch_size
+        )
+        IngredientToRecipe.objects.bulk_create(
+            [
+                IngredientToRecipe(
+                    recipe_id=recipe_id,
+                    product_id=product_id,
+                    amount=self.random.randint(1, 500)
+                )
+                for recipe_id in recipe_ids
+                for product_id in self.random.sample(
+                    product_ids, min(ingredients_per_recipe, len(product_ids)))
+            ],
+            batch_size=self.batch_size
+        )
+        return recipe_ids
+
+    def seed_pairs(self, model, owner_field, target_field, owner_ids,
+                   target_ids, per_owner, exclude_self=False):
+        """Создает уникальные пары владелец-объект для связующих моделей."""
+        rows = []
+        for owner_id in owner_ids:
+            targets = self.random.sample(
+                target_ids, min(per_owner + exclude_self, len(target_ids)))
+            if exclude_self and owner_id in targets:
+                targets.remove(owner_id)
+            rows.extend(
+                model(**{owner_field: owner_id, target_field: target_id})
+                for target_id in targets[:per_owner]
+            )
+        model.objects.bulk_create(
+            rows, batch_size=self.batch_size, ignore_conflicts=True)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('api.metrics')
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Счетчики одного запроса: число запросов к БД и время по этапам."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.timings = {'db': 0.0, 'serialize': 0.0, 'render': 0.0}
+        self.serializing = False
+
+    def add(self, name, duration):
+        self.timings[name] += duration
+
+    def as_dict(self):
+        data = {
+            f'{name}_ms': round(duration * 1000, 2)
+            for name, duration in self.timings.items()
+        }
+        data['total_ms'] = round(
+            (time.perf_counter() - self.started) * 1000, 2)
+        data['queries'] = self.queries
+        return data
+
+    def server_timing(self):
+        data = self.as_dict()
+        return ', '.join([
+            f'db;dur={data["db_ms"]};desc="{self.queries} queries"',
+            f'serialize;dur={data["serialize_ms"]}',
+            f'render;dur={data["render_ms"]}',
+            f'total;dur={data["total_ms"]}',
+        ])
+
+
+def count_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.add('db', time.perf_counter() - started)
+
+
+def install_query_counter(connection):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+@receiver(connection_created)
+def install_query_counter_on_connect(sender, connection, **kwargs):
+    """
+    Счетчик висит на соединении постоянно и берет метрики из контекста
+    запроса. Так учитываются и запросы из потоков sync_to_async,
+    у которых свои соединения с БД.
+    """
+    install_query_counter(connection)
+
+
+class TimedSerializerMixin:
+    """
+    Добавляет время сериализации к метрикам запроса.
+    Учитывается только внешний вызов, поэтому вложенные сериализаторы
+    с этим же миксином не считаются дважды. Ленивые запросы к БД
+    внутри сериализации входят и в db, и в serialize.
+    """
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializing = False
+            metrics.add('serialize', time.perf_counter() - started)
+
+
+class RequestMetricsMiddleware:
+    """
+    Считает запросы к БД и время БД, сериализации и рендеринга ответа.
+    Результат отдается в заголовке Server-Timing и пишется в лог
+    api.metrics одной JSON-строкой. Медленные запросы, по времени
+    или по числу обращений к БД, пишутся с уровнем WARNING.
+    Для потоковых ответов учитывается только работа до начала отдачи.
+    Работает и в синхронном, и в асинхронном стеке middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        for connection in connections.all():
+            install_query_counter(connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = metrics.server_timing()
+        self.log(request, response, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return response
+        started = time.perf_counter()
+
+        def finish_render(response):
+            metrics.add('render', time.perf_counter() - started)
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+    def log(self, request, response, metrics):
+        data = metrics.as_dict()
+        data.update(
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+        )
+        slow = (
+            data['total_ms'] >= settings.SLOW_REQUEST_MS
+            or metrics.queries >= settings.SLOW_REQUEST_QUERIES
+        )
+        logger.log(
+            logging.WARNING if slow else logging.INFO,
+            json.dumps(data, ensure_ascii=False)
+        )
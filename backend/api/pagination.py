@@ -0,0 +1,94 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+INVALID_CURSOR = 'Неверный курсор.'
+
+
+class RecipeCursorPagination(pagination.BasePagination):
+    """
+    Курсорная пагинация ленты рецептов по ключу (pub_date, id).
+    Вместо COUNT(*) и OFFSET каждая страница выбирается условием
+    по последнему показанному рецепту, что использует составной индекс
+    и не замедляется на дальних страницах. Курсор непрозрачен
+    для клиента: это base64 от даты публикации, id и направления.
+    Для поиска не используется: он сортирует по релевантности.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size is None or not page_size.isdigit():
+            return self.page_size
+        return max(1, min(int(page_size), self.max_page_size))
+
+    def encode_cursor(self, recipe, reverse):
+        position = [recipe.pub_date.isoformat(), recipe.pk, reverse]
+        cursor = base64.urlsafe_b64encode(json.dumps(position).encode())
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor.decode())
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            pub_date, pk, reverse = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(pub_date), int(pk), bool(reverse)
+        except (TypeError, ValueError):
+            raise NotFound(INVALID_CURSOR)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        reverse = False
+        queryset = queryset.order_by('-pub_date', '-pk')
+        if position is not None:
+            pub_date, pk, reverse = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+                ).order_by('pub_date', 'pk')
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+                )
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = position is not None if not reverse else has_more
+        self.page = page
+        return page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
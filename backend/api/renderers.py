@@ -0,0 +1,34 @@
+from rest_framework import renderers
+
+
+class FileRenderer(renderers.BaseRenderer):
+    """
+    Базовый рендерер выгрузки списка покупок.
+    Сами файлы формируются во view, рендерер нужен для выбора формата
+    через параметр format и для вывода ошибок в выбранном формате.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode('utf-8')
+
+
+class PDFRenderer(FileRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class PlainTextRenderer(FileRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(FileRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
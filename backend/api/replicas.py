@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from recipes.versions import INGREDIENTS, RECIPES, TAGS, get_version
+
+PRIMARY = 'default'
+PRIMARY_STICKY_KEY = 'db:primary:{}'
+
+read_database = ContextVar('read_database', default=None)
+
+
+class ReplicaRouter:
+    """
+    Направляет чтение в реплику, выбранную ReplicaMiddleware на время
+    безопасного запроса к API. Пишущие запросы, команды и фоновые
+    задачи читают и пишут только в основную БД.
+    Токены всегда читаются из основной БД: только что выданный токен
+    должен работать сразу, а повторные проверки берутся из кэша.
+
+    Для локальной проверки достаточно двух SQLite-баз, 'default'
+    и 'replica_1' в DATABASES, с DATABASE_REPLICAS = ['replica_1']
+    и migrate для обеих. Реплика при этом не обновляется,
+    поэтому видно, какие чтения ушли в основную БД.
+    """
+
+    primary_apps = ('authtoken',)
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in self.primary_apps:
+            return PRIMARY
+        return read_database.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+
+def replica_may_lag(*names):
+    """
+    Проверяет, что запрос читает с реплики, а данные менялись
+    не раньше REPLICA_STICKY_SECONDS назад. Такой ответ может
+    отставать, и его нельзя кэшировать или помечать новой версией.
+    """
+    if read_database.get() is None:
+        return False
+    changed = max(get_version(name) for name in names)
+    return time.time_ns() - changed < settings.REPLICA_STICKY_SECONDS * 10**9
+
+
+def get_sticky_key(request):
+    """
+    Клиент определяется по заголовку Authorization: он известен
+    до аутентификации и у пользователя один токен.
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return PRIMARY_STICKY_KEY.format(
+        hashlib.sha256(authorization.encode()).hexdigest())
+
+
+def choose_database(request):
+    if request.method not in SAFE_METHODS or not settings.DATABASE_REPLICAS:
+        return None
+    key = get_sticky_key(request)
+    if key is not None and cache.get(key):
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def finish_response(request, response):
+    """
+    Закрепляет клиента за основной БД после записи, а у ответов,
+    прочитанных с отстающей реплики, убирает ETag и Last-Modified.
+    """
+    if request.method in SAFE_METHODS:
+        if response.has_header('ETag') and replica_may_lag(
+                RECIPES, TAGS, INGREDIENTS):
+            for header in ('ETag', 'Last-Modified'):
+                if response.has_header(header):
+                    del response[header]
+        return
+    if response.status_code >= 400:
+        return
+    key = get_sticky_key(request)
+    if key is not None:
+        cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaMiddleware:
+    """
+    Выбирает реплику для чтения на время безопасного запроса.
+    После успешного пишущего запроса клиент на REPLICA_STICKY_SECONDS
+    закрепляется за основной БД, чтобы сразу видеть свои изменения.
+    Отметка хранится в кэше, поэтому при нескольких воркерах
+    нужен общий CACHE_BACKEND.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = read_database.set(choose_database(request))
+        try:
+            response = self.get_response(request)
+            finish_response(request, response)
+        finally:
+            read_database.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        database = await sync_to_async(
+            choose_database, thread_sensitive=False)(request)
+        token = read_database.set(database)
+        try:
+            response = await self.get_response(request)
+            await sync_to_async(
+                finish_response, thread_sensitive=False)(request, response)
+        finally:
+            read_database.reset(token)
+        return response
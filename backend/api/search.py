@@ -0,0 +1,158 @@
+import bisect
+import re
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, When
+
+from recipes.models import Product, Recipe
+from recipes.versions import INGREDIENTS, RECIPES, get_version
+
+SEARCH_CONFIG = 'russian'
+TOKEN_PATTERN = re.compile(r'\w+')
+NAME_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+
+def normalize(text):
+    """Приводит строку к ключу поиска без учета регистра и буквы 'ё'."""
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """
+    Индекс наименований продуктов в памяти процесса.
+    Хранит отсортированный список ключей, поэтому совпадения по началу
+    слова находятся бинарным поиском, а совпадения по подстроке
+    добавляются после них. Индекс строится лениво при первом поиске
+    и перестраивается, когда меняется версия ингредиентов.
+    """
+
+    def __init__(self):
+        self._entries = None
+
+    def _build(self):
+        products = sorted(
+            Product.objects.all(),
+            key=lambda product: (normalize(product.name), product.id)
+        )
+        return [normalize(product.name) for product in products], products
+
+    def _get_entries(self):
+        version = get_version(INGREDIENTS)
+        entries = self._entries
+        if entries is None or entries[0] != version:
+            entries = (version, *self._build())
+            self._entries = entries
+        return entries[1:]
+
+    def search(self, query, limit=None):
+        """
+        Возвращает продукты, наименование которых начинается с query,
+        а за ними продукты, содержащие query внутри наименования.
+        """
+        keys, products = self._get_entries()
+        query = normalize(query.strip())
+        start = bisect.bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = products[start:end]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for position, key in enumerate(keys):
+            if start <= position < end or query not in key:
+                continue
+            result.append(products[position])
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+class RecipeIndex:
+    """
+    Инвертированный индекс рецептов в памяти процесса для СУБД без
+    полнотекстового поиска. Слово запроса совпадает со всеми словами
+    индекса, которые с него начинаются, что грубо заменяет стемминг.
+    Рецепт должен содержать все слова запроса, вес совпадения
+    в названии выше, чем в описании. Индекс перестраивается,
+    когда меняется версия рецептов.
+    """
+
+    def __init__(self):
+        self._entries = None
+
+    def _build(self):
+        postings = defaultdict(lambda: defaultdict(int))
+        for recipe_id, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'
+        ).iterator():
+            for token in tokenize(name):
+                postings[token][recipe_id] += NAME_WEIGHT
+            for token in tokenize(text):
+                postings[token][recipe_id] += TEXT_WEIGHT
+        terms = sorted(postings)
+        return terms, [dict(postings[term]) for term in terms]
+
+    def _get_entries(self):
+        version = get_version(RECIPES)
+        entries = self._entries
+        if entries is None or entries[0] != version:
+            entries = (version, *self._build())
+            self._entries = entries
+        return entries[1:]
+
+    def search(self, query):
+        """Возвращает id рецептов, отсортированные по убыванию веса."""
+        terms, postings = self._get_entries()
+        scores = None
+        for token in tokenize(query):
+            token_scores = defaultdict(int)
+            position = bisect.bisect_left(terms, token)
+            while position < len(terms) and terms[position].startswith(token):
+                for recipe_id, weight in postings[position].items():
+                    token_scores[recipe_id] += weight
+                position += 1
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    recipe_id: score + token_scores[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in token_scores
+                }
+        if not scores:
+            return []
+        return sorted(scores, key=lambda recipe_id: -scores[recipe_id])
+
+
+def search_recipes(queryset, query):
+    """
+    Фильтрует рецепты по поисковой строке и сортирует по релевантности.
+    На PostgreSQL используется tsvector с русской конфигурацией,
+    на остальных СУБД индекс в памяти процесса.
+    """
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-pub_date')
+    recipe_ids = recipe_index.search(query)
+    if not recipe_ids:
+        return queryset.none()
+    rank = Case(
+        *[When(pk=recipe_id, then=position)
+          for position, recipe_id in enumerate(recipe_ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(pk__in=recipe_ids).order_by(rank, '-pub_date')
+
+
+ingredient_index = IngredientIndex()
+recipe_index = RecipeIndex()
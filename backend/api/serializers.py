@@ -1,10 +1,14 @@
 import base64
+from contextlib import contextmanager
 from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
 from users.models import Follow
+from recipes.carts import change_recipe_carts
 from recipes.models import (
+    TAGS_LIMIT,
     Tag,
     Product,
     Recipe,
@@ -12,14 +16,23 @@ from recipes.models import (
     Favorite,
     IngredientToRecipe
 )
+from .images import (
+    CARD, JPEG, THUMBNAIL, WEBP, compress_image, get_rendition_url
+)
+from .metrics import TimedSerializerMixin
+from .utils import (
+    get_followed_author_ids, get_recipes_limit, set_prefetched
+)
 
 WRONG_PASSWORD = 'Введен неверный пароль'
 SAME_PASSWORD = 'Старый и новый пароли не могут совпадать!'
+DUPLICATE_RECIPE = 'Такой рецепт уже существует.'
+DUPLICATE_INGREDIENTS = 'Ингредиенты не должны повторяться.'
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для работы с пользователями."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -40,12 +53,9 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Метод проверяет подписку на пользователя."""
-        if self.context['request'].user.is_authenticated:
-            current_user = self.context['request'].user
-            return Follow.objects.filter(
-                author__username=obj.username,
-                follower=current_user
-            ).exists()
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return obj.id in get_followed_author_ids(request)
         return False
 
     def create(self, validated_data):
@@ -81,7 +91,7 @@ class SetPasswordSerializer(serializers.Serializer):
         return new_password
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор подписок с выводом рецептов."""
 
     username = serializers.CharField(source='author.username')
@@ -91,7 +101,7 @@ class FollowSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='author.email')
     is_subscribed = serializers.BooleanField(default=True)
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(source='author.recipes_count')
 
     class Meta:
         model = Follow
@@ -107,23 +117,27 @@ class FollowSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes(self, obj):
-        recipes = obj.author.recipes.all()
+        recipes = getattr(obj.author, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.author.recipes.all()
+            request = self.context.get('request')
+            recipes_limit = request and get_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         serialized_recipes = []
         for recipe in recipes:
             serialized_recipe = {
                 'id': recipe.id,
                 'name': recipe.name,
-                'image': getattr(recipe.image, 'url'),
+                'image': get_rendition_url(recipe, THUMBNAIL),
+                'image_webp': get_rendition_url(recipe, THUMBNAIL, WEBP),
                 'cooking_time': recipe.cooking_time
             }
             serialized_recipes.append(serialized_recipe)
         return serialized_recipes
 
-    def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
 
-
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор тегов."""
 
     class Meta:
@@ -135,8 +149,13 @@ class TagSerializer(serializers.ModelSerializer):
             'slug'
         )
 
+    def validate(self, data):
+        if self.instance is None and Tag.get_free_bit() is None:
+            raise serializers.ValidationError(TAGS_LIMIT)
+        return data
+
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор ингридиентов."""
 
     class Meta:
@@ -149,10 +168,13 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientToPostRecipeSerializer(serializers.Serializer):
-    """Сериализатор ингридиентов."""
+    """
+    Сериализатор ингридиентов. Существование продуктов проверяется
+    в CreateRecipeSerializer одним запросом на весь рецепт.
+    """
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
-    amount = serializers.IntegerField()
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1)
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -176,12 +198,29 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         )
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class RenditionImageField(serializers.ReadOnlyField):
+    """Адрес уменьшенной копии изображения рецепта."""
+
+    def __init__(self, rendition, image_format=JPEG, **kwargs):
+        self.rendition = rendition
+        self.image_format = image_format
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        url = get_rendition_url(recipe, self.rendition, self.image_format)
+        request = self.context.get('request')
+        if url is not None and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class FavoriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор избранных рецептов."""
 
     id = serializers.IntegerField(source='recipe.id')
     name = serializers.CharField(source='recipe.name')
-    image = serializers.ImageField(source='recipe.image')
+    image = RenditionImageField(THUMBNAIL, source='recipe')
+    image_webp = RenditionImageField(THUMBNAIL, WEBP, source='recipe')
     cooking_time = serializers.IntegerField(source='recipe.cooking_time')
 
     class Meta:
@@ -190,16 +229,19 @@ class FavoriteSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_webp',
             'cooking_time'
         )
 
 
-class PurchaseListSerializer(serializers.ModelSerializer):
+class PurchaseListSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """Сериализатор для добавленя и удаления рецепта в/из списка покупок."""
 
     id = serializers.IntegerField(source='recipe.id')
     name = serializers.CharField(source='recipe.name')
-    image = serializers.ImageField(source='recipe.image')
+    image = RenditionImageField(THUMBNAIL, source='recipe')
+    image_webp = RenditionImageField(THUMBNAIL, WEBP, source='recipe')
     cooking_time = serializers.IntegerField(source='recipe.cooking_time')
 
     class Meta:
@@ -208,6 +250,7 @@ class PurchaseListSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_webp',
             'cooking_time'
         )
 
@@ -225,6 +268,15 @@ class ReturnPurchaseListSerializer(serializers.ModelSerializer):
         pass
 
 
+class ShoppingListIngredientSerializer(TimedSerializerMixin,
+                                       serializers.Serializer):
+    """Сериализатор суммарного количества ингридиента в списке покупок."""
+
+    name = serializers.CharField()
+    measurement_unit = serializers.CharField()
+    amount = serializers.IntegerField(source='total_amount')
+
+
 class Base64ToImage(serializers.ImageField):
     """Сериализатор для преобразования формата изображения."""
 
@@ -233,10 +285,10 @@ class Base64ToImage(serializers.ImageField):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+        return compress_image(super().to_internal_value(data))
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор возвращаемых рецептов."""
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -247,6 +299,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     author = UserSerializer(default=serializers.CurrentUserDefault())
     image = Base64ToImage()
+    image_card = RenditionImageField(CARD, source='*')
+    image_card_webp = RenditionImageField(CARD, WEBP, source='*')
 
     class Meta:
         model = Recipe
@@ -257,6 +311,8 @@ class RecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'image_card',
+            'image_card_webp',
             'cooking_time',
             'text',
             'is_favorited',
@@ -264,23 +320,37 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
+        """
+        Берет флаг из аннотации queryset, если она есть.
+        Запрос выполняется только для рецепта без аннотации.
+        """
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.is_favorited.filter(author=request.user).exists()
-        return False
+        if not request or not request.user.is_authenticated:
+            return False
+        if hasattr(obj, 'favorited'):
+            return obj.favorited
+        return obj.is_favorited.filter(author=request.user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        """
+        Берет флаг из аннотации queryset, если она есть.
+        Запрос выполняется только для рецепта без аннотации.
+        """
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.is_in_shopping_cart.filter(author=request.user).exists()
-        return False
+        if not request or not request.user.is_authenticated:
+            return False
+        if hasattr(obj, 'in_shopping_cart'):
+            return obj.in_shopping_cart
+        return obj.is_in_shopping_cart.filter(author=request.user).exists()
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор создания рецептов."""
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True, read_only=False
-    )
+    """
+    Сериализатор создания рецептов.
+    Теги и продукты проверяются одним запросом IN на весь список,
+    а при обновлении в БД записывается только разница с текущим рецептом.
+    """
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientToPostRecipeSerializer(many=True)
     image = Base64ToImage()
     author = UserSerializer(default=serializers.CurrentUserDefault())
@@ -298,48 +368,155 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'author'
         )
-
+        # Уникальность имени у автора проверяет база при сохранении.
+        validators = []
+
+    def get_in_bulk(self, model, ids, known):
+        """
+        Возвращает объекты по id. Объекты из known, уже подгруженные
+        для обновляемого рецепта, повторно не запрашиваются.
+        """
+        objects = {pk: known[pk] for pk in ids if pk in known}
+        missing = set(ids) - set(objects)
+        if missing:
+            objects.update(model.objects.in_bulk(missing))
+        return objects
+
+    def validate_tags(self, value):
+        known = {}
+        if self.instance is not None:
+            known = {tag.id: tag for tag in self.instance.tags.all()}
+        tags = self.get_in_bulk(Tag, value, known)
+        missing = set(value) - set(tags)
+        if missing:
+            raise serializers.ValidationError(
+                f'Тегов не существует: {sorted(missing)}.')
+        return [tags[pk] for pk in dict.fromkeys(value)]
+
+    def validate_ingredients(self, value):
+        product_ids = [ingredient['id'] for ingredient in value]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError(DUPLICATE_INGREDIENTS)
+        known = {}
+        if self.instance is not None:
+            known = {
+                ingredient.product_id: ingredient.product
+                for ingredient in self.instance.ingredientsincide.all()
+            }
+        products = self.get_in_bulk(Product, product_ids, known)
+        missing = set(product_ids) - set(products)
+        if missing:
+            raise serializers.ValidationError(
+                f'Продуктов не существует: {sorted(missing)}.')
+        return [
+            {'id': products[ingredient['id']], 'amount': ingredient['amount']}
+            for ingredient in value
+        ]
+
+    @contextmanager
+    def unique_name(self):
+        """
+        Превращает нарушение уникальности (author, name) в ошибку
+        валидации. Вызывается внутри atomic: ошибка откатывает
+        все изменения рецепта.
+        """
+        try:
+            yield
+        except IntegrityError:
+            raise serializers.ValidationError({'error': DUPLICATE_RECIPE})
+
+    @transaction.atomic
     def create(self, validated_data):
-        base_recipe = Recipe.objects.create(
-            author=validated_data['author'],
-            image=validated_data['image'],
-            name=validated_data['name'],
-            text=validated_data['text'],
-            cooking_time=validated_data['cooking_time']
-        )
-        base_recipe.tags.set(validated_data['tags'])
-        base_recipe.save()
-        ingredients_to_create = []
-        for ingredient in validated_data['ingredients']:
-            ingredients_to_create.append(
+        with self.unique_name():
+            base_recipe = Recipe.objects.create(
+                author=validated_data['author'],
+                image=validated_data['image'],
+                name=validated_data['name'],
+                text=validated_data['text'],
+                cooking_time=validated_data['cooking_time']
+            )
+        base_recipe.tags.add(*validated_data['tags'])
+        set_prefetched(base_recipe, 'tags', sorted(
+            validated_data['tags'], key=lambda tag: tag.name))
+        set_prefetched(
+            base_recipe, 'ingredientsincide',
+            IngredientToRecipe.objects.bulk_create([
                 IngredientToRecipe(
                     recipe=base_recipe,
                     product=ingredient['id'],
                     amount=ingredient['amount']
                 )
-            )
-        IngredientToRecipe.objects.bulk_create(ingredients_to_create)
+                for ingredient in validated_data['ingredients']
+            ])
+        )
         return base_recipe
 
+    def update_tags(self, instance, tags):
+        current_ids = {tag.id for tag in instance.tags.all()}
+        new_ids = {tag.id for tag in tags}
+        if current_ids - new_ids:
+            instance.tags.remove(*(current_ids - new_ids))
+        if new_ids - current_ids:
+            instance.tags.add(*(new_ids - current_ids))
+        set_prefetched(
+            instance, 'tags', sorted(tags, key=lambda tag: tag.name))
+
+    def update_ingredients(self, instance, ingredients_data):
+        """
+        Применяет к ингредиентам рецепта только разницу и переносит
+        изменение количеств в списки покупок, где есть рецепт.
+        Текущие ингредиенты берутся из prefetch_related, итоговые
+        кладутся туда же для ответа.
+        """
+        current = {
+            ingredient.product_id: ingredient
+            for ingredient in instance.ingredientsincide.all()
+        }
+        ingredients = []
+        to_create = []
+        to_update = []
+        deltas = {}
+        for ingredient_data in ingredients_data:
+            product = ingredient_data['id']
+            amount = ingredient_data['amount']
+            ingredient = current.pop(product.id, None)
+            if ingredient is None:
+                ingredient = IngredientToRecipe(
+                    recipe=instance,
+                    product=product,
+                    amount=amount
+                )
+                to_create.append(ingredient)
+                deltas[product.id] = amount
+            elif ingredient.amount != amount:
+                deltas[product.id] = amount - ingredient.amount
+                ingredient.amount = amount
+                to_update.append(ingredient)
+            ingredients.append(ingredient)
+        if current:
+            IngredientToRecipe.objects.filter(
+                pk__in=[ingredient.pk for ingredient in current.values()]
+            ).delete()
+            for product_id, ingredient in current.items():
+                deltas[product_id] = -ingredient.amount
+        if to_update:
+            IngredientToRecipe.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            IngredientToRecipe.objects.bulk_create(to_create)
+        set_prefetched(instance, 'ingredientsincide', ingredients)
+        change_recipe_carts(instance.pk, deltas)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.name = validated_data.get('name', instance.name)
         instance.image = validated_data.get('image', instance.image)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time)
-        instance.tags.set(validated_data.get('tags', instance.tags.all()))
-        ingredients_data = validated_data.get('ingredients')
-        if ingredients_data is not None:
-            instance.ingredients.clear()
-            ingredients_to_create = [
-                IngredientToRecipe(
-                    recipe=instance,
-                    product=ingredient_data.get('id'),
-                    amount=ingredient_data.get('amount')
-                )
-                for ingredient_data in ingredients_data
-                if ingredient_data.get('id') and ingredient_data.get('amount')
-            ]
-            IngredientToRecipe.objects.bulk_create(ingredients_to_create)
-        instance.save()
+        if 'tags' in validated_data:
+            self.update_tags(instance, validated_data['tags'])
+        if 'ingredients' in validated_data:
+            self.update_ingredients(instance, validated_data['ingredients'])
+        with self.unique_name():
+            instance.save(update_fields=Recipe.CONTENT_FIELDS)
         return instance
@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (
+    IngredientToRecipe, Product, Recipe, Tag
+)
+from recipes.versions import INGREDIENTS, RECIPES, TAGS, bump_version
+from .authentication import invalidate_token, invalidate_user_tokens
+from .images import enqueue_renditions
+
+User = get_user_model()
+
+# Поля пользователя, которых нет в ответах с рецептами: вход в систему
+# и смена пароля не должны сбрасывать кэш рецептов.
+PRIVATE_USER_FIELDS = {'last_login', 'password'}
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    """Сбрасывает кэш удаленного токена, в том числе при logout."""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_inactive_user_tokens(instance, **kwargs):
+    """Деактивированный пользователь не должен проходить по кэшу токенов."""
+    if not instance.is_active:
+        invalidate_user_tokens(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_ingredients_version(**kwargs):
+    """
+    Обновляет версию ингредиентов: по ней перестраивается индекс поиска
+    и меняется ETag списка ингредиентов.
+    """
+    bump_version(INGREDIENTS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(**kwargs):
+    """Обновляет версию тегов, по ней меняется ETag списка тегов."""
+    bump_version(TAGS)
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_renditions(instance, **kwargs):
+    """Ставит в очередь построение копий нового изображения рецепта."""
+    enqueue_renditions(instance)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientToRecipe)
+@receiver(post_delete, sender=IngredientToRecipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_recipes_version(**kwargs):
+    """
+    Обновляет версию рецептов, сбрасывая кэш ответов
+    для анонимных пользователей и ETag рецептов.
+    """
+    bump_version(RECIPES)
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(instance, created, update_fields, **kwargs):
+    """Данные автора входят в кэшированные ответы с рецептами."""
+    if created:
+        return
+    if update_fields is not None and set(update_fields) <= PRIVATE_USER_FIELDS:
+        return
+    bump_version(RECIPES)
@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+@contextmanager
+def query_budget(max_queries, using='default'):
+    """
+    Проверяет, что код внутри блока выполняет не больше max_queries
+    запросов к БД. Модуль нужен только тестам, рабочий код
+    его не импортирует:
+
+        with query_budget(5):
+            client.get('/api/recipes/')
+    """
+    connection = connections[using]
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    if len(context) > max_queries:
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        raise AssertionError(
+            f'Выполнено {len(context)} запросов к БД '
+            f'при бюджете {max_queries}:\n{queries}'
+        )
@@ -0,0 +1,622 @@
+import base64
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    CartItem, Favorite, IngredientToRecipe, Product, PurchaseList, Recipe,
+    ShoppingListJob, Tag
+)
+from recipes.tests import fill_tags
+from recipes.versions import INGREDIENTS, RECIPES, get_version
+from users.models import Follow
+from .images import RENDITION_JOB_KEY, _run_renditions
+from .jobs import (
+    DONE, FAILED, PENDING, get_cart_snapshot, run_job, run_pool_job
+)
+from .testing import query_budget
+from .utils import FONT, JsonToPdf
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+TEMP_ROOT = tempfile.mkdtemp()
+MEDIA_ROOT = os.path.join(TEMP_ROOT, 'media')
+PDF_ROOT = os.path.join(TEMP_ROOT, 'shopping_lists')
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_ROOT, ignore_errors=True)
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username, 'password', f'{username}@example.com', 'Имя', 'Фамилия')
+
+
+def create_recipe(author, name, amounts):
+    """Создает рецепт с ингредиентами вида {продукт: количество}."""
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='Описание', cooking_time=10,
+        image='recipes/images/test.jpg'
+    )
+    IngredientToRecipe.objects.bulk_create(
+        IngredientToRecipe(recipe=recipe, product=product, amount=amount)
+        for product, amount in amounts.items()
+    )
+    return recipe
+
+
+def get_image():
+    """Картинка в base64, как ее присылает фронтенд."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+def read(response):
+    """Дочитывает потоковый ответ, чтобы его запросы попали в замер."""
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+class APITestCase(TestCase):
+    """Общие данные: два пользователя, продукты и клиенты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.author = create_user('author')
+        Product.objects.bulk_create(
+            Product(name=f'Продукт {number}', measurement_unit='г')
+            for number in range(10)
+        )
+        cls.products = list(Product.objects.order_by('pk'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.anonymous = APIClient()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, SHOPPING_LIST_PDF_ROOT=PDF_ROOT)
+class ShoppingListQueriesTest(APITestCase):
+    """Число запросов выгрузки списка покупок не зависит от корзины."""
+
+    def fill_cart(self, start, end):
+        for number in range(start, end):
+            recipe = create_recipe(self.author, f'Рецепт {number}', {
+                self.products[(number + shift) % len(self.products)]: 10
+                for shift in range(3)
+            })
+            PurchaseList.objects.create(author=self.user, recipe=recipe)
+
+    def count_queries(self, url, params):
+        with CaptureQueriesContext(connection) as context:
+            response = read(self.client.get(url, params))
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assert_constant_queries(self, url, params=None):
+        """Оба замера идут после изменения корзины, как при выгрузке."""
+        read(self.client.get(url, params))
+        self.fill_cart(0, 2)
+        queries = self.count_queries(url, params)
+        self.fill_cart(2, 12)
+        with query_budget(queries):
+            read(self.client.get(url, params))
+
+    def test_preview(self):
+        self.assert_constant_queries(reverse('shopping-cart-preview'))
+
+    def test_download_txt(self):
+        self.assert_constant_queries(
+            reverse('get-shopping-cart'), {'format': 'txt'})
+
+    def test_download_pdf(self):
+        self.assert_constant_queries(
+            reverse('get-shopping-cart'), {'format': 'pdf'})
+
+    def test_text_formats_headers(self):
+        for export_format, media_type in (
+                ('txt', 'text/plain'), ('csv', 'text/csv')):
+            response = read(self.client.get(
+                reverse('get-shopping-cart'), {'format': export_format}))
+            self.assertEqual(
+                response['Content-Type'], f'{media_type}; charset=utf-8')
+            self.assertEqual(
+                response['Content-Disposition'],
+                f'attachment; filename="recipe.{export_format}"')
+
+    def test_totals(self):
+        self.fill_cart(0, 2)
+        response = self.client.get(reverse('shopping-cart-preview'))
+        self.assertEqual(
+            {item['name']: item['amount'] for item in response.data},
+            {
+                self.products[0].name: 10,
+                self.products[1].name: 20,
+                self.products[2].name: 20,
+                self.products[3].name: 10,
+            }
+        )
+
+
+class TogglesTest(APITestCase):
+    """Повторное добавление дает 400 и не меняет счетчики дважды."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(
+            self.author, 'Рецепт', {self.products[0]: 100})
+
+    def toggle(self, name, pk, add=True):
+        url = reverse(name, args=[pk])
+        return self.client.post(url) if add else self.client.delete(url)
+
+    def assert_toggle(self, name, pk, rows, counter=None):
+        """Проверяет добавление, дубликат, удаление и неизвестный объект."""
+        self.assertEqual(self.toggle(name, pk).status_code, 201)
+        self.assertEqual(self.toggle(name, pk).status_code, 400)
+        self.assertEqual(rows.count(), 1)
+        if counter is not None:
+            self.recipe.refresh_from_db()
+            self.assertEqual(getattr(self.recipe, counter), 1)
+        self.assertEqual(self.toggle(name, pk, add=False).status_code, 204)
+        self.assertEqual(self.toggle(name, pk, add=False).status_code, 400)
+        self.assertFalse(rows.exists())
+        if counter is not None:
+            self.recipe.refresh_from_db()
+            self.assertEqual(getattr(self.recipe, counter), 0)
+        self.assertEqual(self.toggle(name, 0).status_code, 404)
+        self.assertEqual(self.toggle(name, 0, add=False).status_code, 404)
+
+    def test_favorite(self):
+        self.assert_toggle(
+            'favorite-recipes', self.recipe.pk,
+            Favorite.objects.filter(author=self.user), 'favorites_count')
+
+    def test_shopping_cart(self):
+        name = 'retrieve-delete-shopping-list'
+        self.toggle(name, self.recipe.pk)
+        self.toggle(name, self.recipe.pk)
+        self.assertEqual(
+            CartItem.objects.get(user=self.user).total_amount, 100)
+        self.toggle(name, self.recipe.pk, add=False)
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+        self.assert_toggle(
+            name, self.recipe.pk,
+            PurchaseList.objects.filter(author=self.user), 'in_carts_count')
+
+    def test_follow(self):
+        self.assert_toggle(
+            'follow-list-create', self.author.pk,
+            Follow.objects.filter(follower=self.user))
+        response = self.toggle('follow-list-create', self.user.pk)
+        self.assertEqual(response.status_code, 400)
+
+
+class TagsLimitTest(APITestCase):
+    """Лимит тегов возвращается ошибкой 400, а не 500."""
+
+    def create_tag(self):
+        return self.client.post(
+            reverse('tags-list'), {'name': 'Новый', 'color': '#00FF00'})
+
+    def test_create_tag(self):
+        self.assertEqual(self.create_tag().status_code, 201)
+
+    def test_tags_limit(self):
+        fill_tags()
+        response = self.create_tag()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data)
+
+
+class RecipeEtagTest(APITestCase):
+    """ETag рецепта для пользователя проверяется без лишних запросов."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(
+            self.author, 'Рецепт', {self.products[0]: 100})
+        self.url = reverse('recipes-detail', args=[self.recipe.pk])
+
+    def test_not_modified(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_flags_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Favorite.objects.create(author=self.user, recipe=self.recipe)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+        Follow.objects.create(follower=self.user, author=self.author)
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+    def test_anonymous(self):
+        response = self.anonymous.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        response = self.anonymous.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeUpdateTest(APITestCase):
+    """Обновление рецепта не перечитывает уже загруженные связи."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.author)
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#FF0000', slug='breakfast')
+        self.recipe = create_recipe(self.author, 'Рецепт', {
+            self.products[0]: 100, self.products[1]: 50})
+        self.recipe.tags.add(self.tag)
+        PurchaseList.objects.create(author=self.user, recipe=self.recipe)
+        self.url = reverse('recipes-detail', args=[self.recipe.pk])
+
+    def recipe_data(self, ingredients, **fields):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': get_image(),
+            'tags': [self.tag.pk],
+            'ingredients': [
+                {'id': product.pk, 'amount': amount}
+                for product, amount in ingredients.items()
+            ],
+            **fields
+        }
+
+    def patch(self, ingredients, status=200, **fields):
+        response = self.client.patch(
+            self.url, self.recipe_data(ingredients, **fields), format='json')
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_one_field(self):
+        with query_budget(8):
+            response = self.patch(
+                {self.products[0]: 100, self.products[1]: 50},
+                cooking_time=20)
+        self.assertEqual(response.data['cooking_time'], 20)
+        self.assertEqual(
+            [tag['id'] for tag in response.data['tags']], [self.tag.pk])
+
+    def test_concurrent_favorite(self):
+        """Избранное и копии, записанные после загрузки, не теряются."""
+        get_object = RecipeViewSet.get_object
+
+        def get_object_then_change(view):
+            recipe = get_object(view)
+            Favorite.objects.create(author=self.user, recipe=self.recipe)
+            Recipe.objects.filter(pk=self.recipe.pk).update(
+                renditions_for='recipes/images/test.jpg')
+            return recipe
+
+        with mock.patch.object(
+                RecipeViewSet, 'get_object', get_object_then_change):
+            self.patch(
+                {self.products[0]: 100, self.products[1]: 50},
+                name='Новое имя')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое имя')
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(self.recipe.renditions_for, 'recipes/images/test.jpg')
+
+    def test_duplicate_name(self):
+        """Совпадение имени ловит база, изменения откатываются."""
+        create_recipe(self.author, 'Другой', {})
+        response = self.patch(
+            {self.products[0]: 70}, status=400, name='Другой')
+        self.assertIn('error', response.data)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Рецепт')
+        self.assertEqual(self.recipe.ingredientsincide.count(), 2)
+        self.assertEqual(
+            CartItem.objects.get(
+                user=self.user, product=self.products[0]).total_amount,
+            100)
+
+    def test_create_duplicate(self):
+        response = self.client.post(
+            reverse('recipes-list'),
+            self.recipe_data({self.products[0]: 10}), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+        self.assertEqual(Recipe.objects.filter(author=self.author).count(), 1)
+
+    def test_ingredients(self):
+        with query_budget(17):
+            response = self.patch({self.products[0]: 70, self.products[2]: 5})
+        self.assertEqual(
+            {(item['id'], item['amount'])
+             for item in response.data['ingredients']},
+            {(self.products[0].pk, 70), (self.products[2].pk, 5)}
+        )
+        self.assertEqual(
+            dict(CartItem.objects.filter(user=self.user).values_list(
+                'product', 'total_amount')),
+            {self.products[0].pk: 70, self.products[2].pk: 5}
+        )
+
+
+class RecipeImportTest(APITestCase):
+    """Ошибки отдельных строк импорта попадают в отчет, а не в 500."""
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+
+    def line(self, name, ingredients=('Соль',), tags=('breakfast',)):
+        return json.dumps({
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'author': self.author.email,
+            'image': 'recipes/images/test.jpg',
+            'tags': [
+                {'name': slug, 'color': '#FF0000', 'slug': slug}
+                for slug in tags
+            ],
+            'ingredients': [
+                {'name': name, 'measurement_unit': 'г', 'amount': 5}
+                for name in ingredients
+            ],
+        }, ensure_ascii=False)
+
+    def import_lines(self, *lines):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('recipes-import'), '\n'.join(lines).encode(),
+                content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assert_imported(self, report, created, error_lines):
+        self.assertEqual(report['created'], created)
+        self.assertEqual(
+            [error['line'] for error in report['errors']], error_lines)
+        self.assertEqual(
+            Recipe.objects.filter(author=self.author).count(), created)
+
+    def test_duplicate_ingredients(self):
+        report = self.import_lines(
+            self.line('Первый'), self.line('Второй', ('Соль', 'Соль')))
+        self.assert_imported(report, 1, [2])
+
+    def test_tags_limit(self):
+        fill_tags()
+        report = self.import_lines(
+            self.line('Первый', tags=('tag-0',)), self.line('Второй'))
+        self.assert_imported(report, 1, [2])
+        self.assertIn('tags', report['errors'][0]['errors'])
+
+    def test_new_products_bump_version(self):
+        version = get_version(INGREDIENTS)
+        self.import_lines(self.line('Первый'))
+        self.assertNotEqual(get_version(INGREDIENTS), version)
+        self.assertTrue(Product.objects.filter(name='Соль').exists())
+
+
+class RecipeSearchPaginationTest(APITestCase):
+    """Курсор не сбивает порядок результатов поиска по релевантности."""
+
+    def setUp(self):
+        super().setUp()
+        self.best = create_recipe(self.author, 'Борщ', {})
+        self.other = create_recipe(self.author, 'Суп', {})
+        Recipe.objects.filter(pk=self.other.pk).update(text='Почти борщ')
+
+    def search(self, **params):
+        response = self.client.get(
+            reverse('recipes-list'), {'search': 'борщ', **params})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_ranked_with_cursor(self):
+        expected = [self.best.pk, self.other.pk]
+        self.assertEqual(self.search(), expected)
+        self.assertEqual(self.search(cursor=''), expected)
+
+
+class VersionsTest(APITestCase):
+    """Версии меняются после фиксации транзакции и при правке автора."""
+
+    def assert_bumped(self, action, bumped=True):
+        version = get_version(RECIPES)
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+            self.assertEqual(get_version(RECIPES), version)
+        self.assertEqual(get_version(RECIPES) != version, bumped)
+
+    def test_recipe_change(self):
+        self.assert_bumped(lambda: create_recipe(self.author, 'Рецепт', {}))
+
+    def test_author_change(self):
+        self.author.first_name = 'Другое'
+        self.assert_bumped(self.author.save)
+
+    def test_login_keeps_version(self):
+        self.assert_bumped(
+            lambda: self.author.save(update_fields=['last_login']), False)
+
+    def test_new_user_keeps_version(self):
+        self.assert_bumped(lambda: create_user('new'), False)
+
+
+@override_settings(SHOPPING_LIST_PDF_ROOT=PDF_ROOT)
+class ShoppingListJobsTest(APITestCase):
+    """Задачи PDF принадлежат пользователю, файлы отдаются через API."""
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.recipe = create_recipe(
+            self.author, 'Рецепт', {self.products[0]: 100})
+        for user in (self.user, self.author):
+            PurchaseList.objects.create(author=user, recipe=self.recipe)
+
+    def enqueue(self, client):
+        """Ставит задачу и выполняет ее в текущем потоке."""
+        with self.captureOnCommitCallbacks():
+            response = client.post(reverse('shopping-cart-jobs'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], PENDING)
+        for job in ShoppingListJob.objects.filter(status=PENDING):
+            _, recipe_names, ingredients = get_cart_snapshot(job.user)
+            run_job(job, recipe_names, ingredients)
+        return response.data['id']
+
+    def get_job(self, client, job_id):
+        return client.get(
+            reverse('shopping-cart-job-detail', args=[job_id]))
+
+    def test_done_job_served_to_owner(self):
+        job_id = self.enqueue(self.client)
+        response = self.get_job(self.client, job_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        response = self.client.post(reverse('shopping-cart-jobs'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'id': job_id, 'status': DONE})
+
+    def test_job_hidden_from_other_users(self):
+        PurchaseList.objects.filter(author=self.author).delete()
+        job_id = self.enqueue(self.client)
+        self.assertEqual(self.get_job(self.author_client, job_id).status_code,
+                         404)
+
+    def test_other_user_cart_change_keeps_pdf(self):
+        job_id = self.enqueue(self.client)
+        self.assertEqual(self.enqueue(self.author_client), job_id)
+        PurchaseList.objects.filter(author=self.author).delete()
+        self.enqueue(self.author_client)
+        self.assertEqual(self.get_job(self.client, job_id).status_code, 200)
+
+    def test_cart_change_replaces_pdf(self):
+        job_id = self.enqueue(self.client)
+        recipe = create_recipe(self.author, 'Другой', {self.products[1]: 5})
+        PurchaseList.objects.create(author=self.user, recipe=recipe)
+        new_job_id = self.enqueue(self.client)
+        self.assertNotEqual(new_job_id, job_id)
+        self.assertEqual(self.get_job(self.client, job_id).status_code, 404)
+        self.assertEqual(
+            self.get_job(self.client, new_job_id).status_code, 200)
+
+    def test_failed_job(self):
+        with self.captureOnCommitCallbacks():
+            response = self.client.post(reverse('shopping-cart-jobs'))
+        job = ShoppingListJob.objects.get(user=self.user)
+        with mock.patch('api.jobs.render_pdf', side_effect=OSError):
+            with self.assertRaises(OSError):
+                run_job(job, [], [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(
+            self.get_job(self.client, response.data['id']).status_code, 500)
+
+
+class PoolJobTest(SimpleTestCase):
+    """Задача пула проверяет соединения с БД и пишет ошибки в лог."""
+
+    @mock.patch('api.jobs.close_old_connections')
+    def test_error_logged(self, close_old_connections):
+        def broken_job(value):
+            raise ValueError(value)
+
+        with self.assertLogs('api.jobs', 'ERROR') as logs:
+            self.assertIsNone(run_pool_job(broken_job, 'ошибка'))
+        self.assertIn('broken_job', logs.output[0])
+        self.assertEqual(close_old_connections.call_count, 2)
+
+    @mock.patch('api.jobs.close_old_connections')
+    def test_result_returned(self, close_old_connections):
+        self.assertEqual(run_pool_job(lambda value: value * 2, 21), 42)
+        self.assertEqual(close_old_connections.call_count, 2)
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT)
+    @mock.patch('api.jobs.close_old_connections')
+    def test_renditions_error_logged(self, close_old_connections):
+        key = RENDITION_JOB_KEY.format('recipes/images/missing.jpg')
+        cache.set(key, PENDING)
+        with self.assertLogs('api.jobs', 'ERROR') as logs:
+            run_pool_job(_run_renditions, 1, 'recipes/images/missing.jpg')
+        self.assertIn('_run_renditions', logs.output[0])
+        self.assertIsNone(cache.get(key))
+
+
+class JsonToPdfTest(SimpleTestCase):
+    """Документы с общим шрифтом из кэша процесса не мешают друг другу."""
+
+    ingredients = [
+        {'name': f'Продукт {number}', 'total_amount': number,
+         'measurement_unit': 'г'}
+        for number in range(40)
+    ]
+
+    def render(self, ingredients=None):
+        pdf = JsonToPdf()
+        pdf_bytes = pdf.json_transformer(
+            ['Рецепт'], ingredients or self.ingredients)
+        return pdf, pdf_bytes
+
+    def test_documents_do_not_share_font_state(self):
+        first, _ = self.render()
+        second, _ = self.render()
+        first_font = first.fonts[FONT.lower()]
+        second_font = second.fonts[FONT.lower()]
+        for name in ('ttfont', 'subset', 'missing_glyphs', 'cw', 'desc'):
+            self.assertIsNot(
+                getattr(first_font, name), getattr(second_font, name), name)
+
+    def test_concurrent_renders(self):
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        try:
+            with ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(
+                    lambda number: self.render()[1], range(40)))
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertTrue(all(
+            pdf_bytes.startswith(b'%PDF') for pdf_bytes in results))
+        self.assertEqual(len({len(pdf_bytes) for pdf_bytes in results}), 1)
+
+    def test_symbols_outside_subset(self):
+        pdf, _ = self.render([
+            {'name': 'Ωмега', 'total_amount': 1, 'measurement_unit': 'шт'}])
+        self.assertEqual(pdf.fonts[FONT.lower()].missing_glyphs, [])
@@ -0,0 +1,316 @@
+import base64
+import json
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import F, prefetch_related_objects
+from rest_framework import serializers
+
+from recipes.models import IngredientToRecipe, Product, Recipe, Tag
+from recipes.versions import INGREDIENTS, RECIPES, bump_version
+from .images import compress_image, enqueue_renditions
+from .serializers import DUPLICATE_INGREDIENTS
+
+User = get_user_model()
+
+EXPORT_CHUNK_SIZE = 500
+IMPORT_CHUNK_SIZE = 500
+
+DUPLICATE_TAGS = 'Теги не должны повторяться.'
+TAG_NOT_CREATED = 'Не удалось создать тег {}.'
+
+
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_tags_mask(tags):
+    mask = 0
+    for tag in tags:
+        mask |= 1 << tag.bit
+    return mask
+
+
+def recipe_to_dict(recipe, inline_images=False):
+    image = recipe.image.name
+    if inline_images and image:
+        with recipe.image.open('rb') as image_file:
+            image = 'data:image/jpeg;base64,' + base64.b64encode(
+                image_file.read()).decode()
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'author': recipe.author.email,
+        'image': image,
+        'tags': [
+            {'name': tag.name, 'color': tag.color, 'slug': tag.slug}
+            for tag in recipe.tags.all()
+        ],
+        'ingredients': [
+            {
+                'name': ingredient.product.name,
+                'measurement_unit': ingredient.product.measurement_unit,
+                'amount': ingredient.amount,
+            }
+            for ingredient in recipe.ingredientsincide.all()
+        ],
+    }
+
+
+def export_recipes(inline_images=False):
+    """
+    Построчно выгружает рецепты в NDJSON.
+    Рецепты читаются серверным курсором, а теги и ингредиенты
+    подгружаются пачками, поэтому память не растет с размером каталога.
+    """
+    recipes = Recipe.objects.select_related('author').order_by('pk').iterator(
+        chunk_size=EXPORT_CHUNK_SIZE)
+    for chunk in chunked(recipes, EXPORT_CHUNK_SIZE):
+        prefetch_related_objects(chunk, 'tags', 'ingredientsincide__product')
+        for recipe in chunk:
+            yield json.dumps(
+                recipe_to_dict(recipe, inline_images), ensure_ascii=False
+            ) + '\n'
+
+
+class ImportTagSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=16)
+    color = serializers.CharField(max_length=7)
+    slug = serializers.SlugField()
+
+
+class ImportIngredientSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    measurement_unit = serializers.CharField(max_length=255)
+    amount = serializers.IntegerField(min_value=1)
+
+
+class ImportRecipeSerializer(serializers.Serializer):
+    """Проверка строки импорта без обращений к БД."""
+
+    name = serializers.CharField(max_length=26)
+    text = serializers.CharField()
+    cooking_time = serializers.IntegerField(min_value=1, max_value=1000)
+    author = serializers.EmailField()
+    image = serializers.CharField()
+    tags = ImportTagSerializer(many=True)
+    ingredients = ImportIngredientSerializer(many=True, allow_empty=False)
+
+    def validate_tags(self, value):
+        slugs = [tag['slug'] for tag in value]
+        if len(set(slugs)) != len(slugs):
+            raise serializers.ValidationError(DUPLICATE_TAGS)
+        return value
+
+    def validate_ingredients(self, value):
+        keys = [
+            (ingredient['name'], ingredient['measurement_unit'])
+            for ingredient in value
+        ]
+        if len(set(keys)) != len(keys):
+            raise serializers.ValidationError(DUPLICATE_INGREDIENTS)
+        return value
+
+    def validate_image(self, value):
+        if not value.startswith('data:image'):
+            return value
+        try:
+            header, data = value.split(';base64,')
+            image = ContentFile(
+                base64.b64decode(data), name='import.' + header.split('/')[-1])
+            return compress_image(image)
+        except (ValueError, OSError):
+            raise serializers.ValidationError('Неверное изображение.')
+
+
+class RecipeImporter:
+    """
+    Импортирует рецепты из NDJSON пачками по IMPORT_CHUNK_SIZE строк.
+    Каждая пачка проверяется целиком несколькими запросами IN
+    и записывается через bulk_create в одной транзакции.
+    Ошибочные строки пропускаются и попадают в отчет с номером строки.
+    Рецепты, которые у автора уже есть, считаются ошибкой,
+    поэтому повторный импорт того же файла не создает дубликатов.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line_number, error):
+        self.errors.append({'line': line_number, 'errors': error})
+
+    def parse(self, lines):
+        for line_number, line in enumerate(lines, start=1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as error:
+                self.add_error(line_number, str(error))
+                continue
+            serializer = ImportRecipeSerializer(data=data)
+            if not serializer.is_valid():
+                self.add_error(line_number, serializer.errors)
+                continue
+            yield line_number, serializer.validated_data
+
+    def run(self, lines):
+        for chunk in chunked(self.parse(lines), IMPORT_CHUNK_SIZE):
+            self.import_chunk(chunk)
+        if self.created:
+            bump_version(RECIPES)
+        return {'created': self.created, 'errors': self.errors}
+
+    def get_tags(self, recipes_data):
+        """
+        Находит или создает теги пачки. Каждый новый тег создается
+        в своей точке сохранения, поэтому конфликт или лимит тегов
+        не прерывает пачку: ошибка возвращается по слагу тега.
+        """
+        tags_data = {
+            tag['slug']: tag
+            for data in recipes_data for tag in data['tags']
+        }
+        tags = {tag.slug: tag for tag in Tag.objects.filter(
+            slug__in=tags_data)}
+        failed = {}
+        for slug, tag_data in tags_data.items():
+            if slug in tags:
+                continue
+            try:
+                with transaction.atomic():
+                    tags[slug], _ = Tag.objects.get_or_create(
+                        slug=slug, defaults=tag_data)
+            except ValidationError as error:
+                failed[slug] = error.messages
+            except IntegrityError:
+                failed[slug] = [TAG_NOT_CREATED.format(slug)]
+        return tags, failed
+
+    def get_products(self, recipes_data):
+        """
+        Создает недостающие продукты. bulk_create не отправляет
+        сигналы, поэтому версия ингредиентов обновляется здесь.
+        """
+        keys = {
+            (ingredient['name'], ingredient['measurement_unit'])
+            for data in recipes_data for ingredient in data['ingredients']
+        }
+        products = self.find_products(keys)
+        missing = keys - set(products)
+        if not missing:
+            return products
+        Product.objects.bulk_create(
+            [Product(name=name, measurement_unit=unit)
+             for name, unit in missing],
+            ignore_conflicts=True
+        )
+        bump_version(INGREDIENTS)
+        return self.find_products(keys)
+
+    def find_products(self, keys):
+        return {
+            (product.name, product.measurement_unit): product
+            for product in Product.objects.filter(
+                name__in={name for name, _ in keys})
+        }
+
+    def get_existing(self, chunk, authors):
+        return set(Recipe.objects.filter(
+            author__in=authors.values(),
+            name__in={data['name'] for _, data in chunk}
+        ).values_list('author__email', 'name'))
+
+    @transaction.atomic
+    def import_chunk(self, chunk):
+        authors = User.objects.in_bulk(
+            {data['author'] for _, data in chunk}, field_name='email')
+        existing = self.get_existing(chunk, authors)
+        valid = []
+        for line_number, data in chunk:
+            key = (data['author'], data['name'])
+            if data['author'] not in authors:
+                self.add_error(line_number, {'author': 'Автор не найден.'})
+            elif key in existing:
+                self.add_error(
+                    line_number, {'name': 'Такой рецепт уже существует.'})
+            else:
+                existing.add(key)
+                valid.append((line_number, data))
+        if not valid:
+            return
+        tags, failed_tags = self.get_tags(data for _, data in valid)
+        lines = []
+        for line_number, data in valid:
+            errors = [
+                message
+                for tag in data['tags']
+                for message in failed_tags.get(tag['slug'], [])
+            ]
+            if errors:
+                self.add_error(line_number, {'tags': errors})
+            else:
+                lines.append((line_number, data))
+        if not lines:
+            return
+        valid = [data for _, data in lines]
+        products = self.get_products(valid)
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                author=authors[data['author']],
+                name=data['name'],
+                text=data['text'],
+                cooking_time=data['cooking_time'],
+                image=data['image'],
+                tags_mask=get_tags_mask(
+                    tags[tag['slug']] for tag in data['tags']),
+            )
+            for data in valid
+        ])
+        if recipes[0].pk is None:
+            ids = {
+                (author_id, name): pk
+                for author_id, name, pk in Recipe.objects.filter(
+                    author__in=authors.values(),
+                    name__in={recipe.name for recipe in recipes}
+                ).values_list('author_id', 'name', 'pk')
+            }
+            for recipe in recipes:
+                recipe.pk = ids[(recipe.author_id, recipe.name)]
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(
+                recipe_id=recipe.pk, tag_id=tags[tag['slug']].pk)
+            for recipe, data in zip(recipes, valid)
+            for tag in data['tags']
+        ], ignore_conflicts=True)
+        IngredientToRecipe.objects.bulk_create([
+            IngredientToRecipe(
+                recipe=recipe,
+                product=products[
+                    (ingredient['name'], ingredient['measurement_unit'])],
+                amount=ingredient['amount']
+            )
+            for recipe, data in zip(recipes, valid)
+            for ingredient in data['ingredients']
+        ])
+        author_counts = {}
+        for recipe in recipes:
+            author_counts[recipe.author_id] = (
+                author_counts.get(recipe.author_id, 0) + 1)
+            enqueue_renditions(recipe)
+        for author_id, count in author_counts.items():
+            User.objects.filter(pk=author_id).update(
+                recipes_count=F('recipes_count') + count)
+        self.created += len(recipes)
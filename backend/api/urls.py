@@ -12,6 +12,11 @@ from .views import (
     FavoriteRetrieveDeleteView,
     ShoppingListRetrieveDeleteView,
     GetShoppingListView,
+    ShoppingListPreviewView,
+    ShoppingListJobCreateView,
+    ShoppingListJobDetailView,
+    RecipeExportView,
+    RecipeImportView,
     RecipeViewSet
 )
 
@@ -57,6 +62,31 @@ urlpatterns = [
         GetShoppingListView.as_view(),
         name='get-shopping-cart'
     ),
+    path(
+        'recipes/shopping_cart/',
+        ShoppingListPreviewView.as_view(),
+        name='shopping-cart-preview'
+    ),
+    path(
+        'recipes/shopping_cart/jobs/',
+        ShoppingListJobCreateView.as_view(),
+        name='shopping-cart-jobs'
+    ),
+    path(
+        'recipes/shopping_cart/jobs/<str:job_id>/',
+        ShoppingListJobDetailView.as_view(),
+        name='shopping-cart-job-detail'
+    ),
+    path(
+        'recipes/export/',
+        RecipeExportView.as_view(),
+        name='recipes-export'
+    ),
+    path(
+        'recipes/import/',
+        RecipeImportView.as_view(),
+        name='recipes-import'
+    ),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include(router.urls)),
 ]
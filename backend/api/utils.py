@@ -1,21 +1,238 @@
+import copy
+import csv
+from functools import lru_cache
 from io import BytesIO
 
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery
+from fontTools import subset, ttLib
 from fpdf import FPDF
+from fpdf.fonts import SubsetMap, TTFFont
+
+from recipes.models import CartItem, Recipe
+from users.models import Follow
 
 
 FONT = 'DejaVuSans'
+FONT_PATH = settings.BASE_DIR / 'fonts' / f'{FONT}-Bold.ttf'
+# Диапазоны символов, которые встречаются в списках покупок:
+# латиница, кириллица, знаки препинания, валюты и дроби.
+FONT_UNICODE_RANGES = (
+    (0x0020, 0x024F),
+    (0x0400, 0x052F),
+    (0x2000, 0x206F),
+    (0x20A0, 0x20CF),
+    (0x2100, 0x218F),
+)
+
+
+def get_shopping_list(user):
+    """
+    Возвращает суммы ингредиентов из списка покупок пользователя.
+    Суммы хранятся в CartItem уже посчитанными, поэтому читается
+    по строке на продукт без агрегации по рецептам.
+    """
+    return CartItem.objects.filter(user=user).values(
+        'total_amount',
+        name=F('product__name'),
+        measurement_unit=F('product__measurement_unit')
+    ).order_by('name', 'measurement_unit')
+
+
+def get_shopping_list_recipes(user):
+    """Возвращает названия рецептов из списка покупок пользователя."""
+    return Recipe.objects.filter(
+        is_in_shopping_cart__author=user
+    ).values_list('name', flat=True)
+
+
+def create_unique(model, **fields):
+    """
+    Создает запись или возвращает None, если такая запись уже есть.
+    Дубликат отсекает уникальное ограничение БД, поэтому параллельные
+    запросы не создают лишних строк. Запись сохраняется обычным save()
+    в точке сохранения: счетчики и суммы списка покупок меняются
+    сигналами в той же транзакции, что и вставка.
+    """
+    try:
+        with transaction.atomic():
+            return model.objects.create(**fields)
+    except IntegrityError:
+        return None
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанную строку вместо хранения."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_to_text(ingredients):
+    """Построчно формирует список покупок в текстовом виде."""
+    yield 'Список покупок:\n'
+    for ingredient in ingredients.iterator():
+        yield (
+            f'{ingredient["name"]} '
+            f'({ingredient["measurement_unit"]}) — '
+            f'{ingredient["total_amount"]}\n'
+        )
+
+
+def shopping_list_to_csv(ingredients):
+    """Построчно формирует список покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients.iterator():
+        yield writer.writerow((
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            ingredient['total_amount']
+        ))
+
+
+def get_followed_author_ids(request):
+    """
+    Возвращает множество id авторов, на которых подписан пользователь.
+    Множество загружается одним запросом и кэшируется на объекте запроса,
+    поэтому все сериализаторы пользователей в рамках запроса
+    используют один и тот же результат.
+    """
+    if not hasattr(request, '_followed_author_ids'):
+        request._followed_author_ids = set(
+            Follow.objects.filter(
+                follower=request.user
+            ).values_list('author_id', flat=True)
+        )
+    return request._followed_author_ids
+
+
+def set_prefetched(instance, name, objects):
+    """
+    Кладет уже известные связанные объекты в кэш prefetch_related,
+    чтобы ответ после записи не перечитывал их из БД.
+    """
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache.pop(name, None)
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance._prefetched_objects_cache[name] = queryset
+
+
+def get_recipes_limit(request):
+    """Возвращает значение параметра recipes_limit или None."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None or not recipes_limit.isdigit():
+        return None
+    return int(recipes_limit)
+
+
+def get_subscriptions(user, recipes_limit=None):
+    """
+    Возвращает подписки пользователя с заранее посчитанным числом
+    рецептов автора и подгруженными рецептами.
+    Ограничение recipes_limit применяется в SQL коррелированным
+    подзапросом, поэтому страница загружается фиксированным
+    числом запросов независимо от количества рецептов у авторов.
+    """
+    recipes = Recipe.objects.order_by('-pub_date')
+    if recipes_limit is not None:
+        recipes = recipes.filter(id__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).order_by('-pub_date').values('id')[:recipes_limit]
+        ))
+    return Follow.objects.filter(
+        follower=user
+    ).select_related(
+        'author'
+    ).prefetch_related(
+        Prefetch('author__recipes', queryset=recipes,
+                 to_attr='limited_recipes')
+    ).order_by('author__username')
+
+
+@lru_cache(maxsize=None)
+def get_font_unicodes():
+    """Возвращает коды всех символов, которые есть в полном шрифте."""
+    return frozenset(ttLib.TTFont(FONT_PATH, lazy=True).getBestCmap())
+
+
+@lru_cache(maxsize=None)
+def load_font(full=False):
+    """
+    Разбирает TTF-файл шрифта один раз на процесс.
+    Обычно шрифт урезается до FONT_UNICODE_RANGES, чтобы при выводе
+    каждого документа fontTools разбирал небольшие таблицы.
+    Полный шрифт (full=True) нужен только документам с символами
+    вне этих диапазонов.
+    Возвращает байты шрифта и прототип шрифта fpdf
+    с уже посчитанными ширинами символов и таблицей глифов.
+    """
+    if full:
+        font_bytes = FONT_PATH.read_bytes()
+    else:
+        ttfont = ttLib.TTFont(FONT_PATH, recalcTimestamp=False)
+        options = subset.Options()
+        options.name_IDs = ['*']
+        options.glyph_names = True
+        options.notdef_outline = True
+        options.drop_tables += ['FFTM']
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=[
+            code
+            for start, end in FONT_UNICODE_RANGES
+            for code in range(start, end + 1)
+        ])
+        subsetter.subset(ttfont)
+        font_bytes = BytesIO()
+        ttfont.save(font_bytes)
+        font_bytes = font_bytes.getvalue()
+    prototype = TTFFont(FPDF(), BytesIO(font_bytes), FONT.lower(), '')
+    prototype.close()
+    return font_bytes, prototype
+
+
+def needs_full_font(text):
+    """Проверяет, есть ли в тексте символы шрифта вне урезанной копии."""
+    _, prototype = load_font()
+    return any(
+        code not in prototype.cmap and code in get_font_unicodes()
+        for code in {ord(char) for char in text}
+    )
 
 
 class JsonToPdf(FPDF):
     """Класс для формирования вывода в PDF."""
 
-    def __init__(self):
-        """Настройка фона."""
-        super().__init__()
-        self.add_font(FONT,
-                      '',
-                      f'fonts/{FONT}-Bold.ttf',
-                      uni=1)
+    def add_cached_font(self, text=''):
+        """
+        Подключает шрифт из кэша процесса вместо повторного разбора TTF.
+        Прототип общий для всех потоков, поэтому из него берутся только
+        таблицы, которые fpdf лишь читает (cmap и номера глифов).
+        Все, что меняется при выводе документа, у каждого документа
+        свое: объект fontTools, который урезается при сохранении,
+        подмножество глифов, список отсутствующих символов,
+        ширины символов (defaultdict дописывает в себя неизвестные
+        символы) и описание шрифта, которому присваивается номер
+        объекта PDF.
+        """
+        font_bytes, prototype = load_font(full=needs_full_font(text))
+        font = copy.copy(prototype)
+        font.i = len(self.fonts) + 1
+        font.ttfont = ttLib.TTFont(BytesIO(font_bytes), recalcTimestamp=False,
+                                   fontNumber=0, lazy=True)
+        font.cw = copy.copy(prototype.cw)
+        font.desc = copy.copy(prototype.desc)
+        font.missing_glyphs = []
+        reserved = '\x00 \r\n'
+        if self.str_alias_nb_pages:
+            reserved += '0123456789' + self.str_alias_nb_pages
+        font.subset = SubsetMap(font, [ord(char) for char in reserved])
+        self.fonts[font.fontkey] = font
 
     def header(self):
         """Настройка шапки."""
@@ -33,50 +250,30 @@ class JsonToPdf(FPDF):
         self.cell(30, 10, 'Foodgram. Inc.', ln=1)
         self.cell(0, 10, f'Page {self.page_no()}', align='C')
 
-    def json_transformer(self, final_ingredients: dict):
+    def json_transformer(self, recipe_names, ingredients):
         """Логика преобразования в PDF."""
+        recipes_info = (
+            f'Список покупок для рецептов {", ".join(recipe_names)}.'
+        )
+        ingredients_info = [
+            f'{ingredient["name"]} '
+            f'в количестве {ingredient["total_amount"]} '
+            f'{ingredient["measurement_unit"]}'
+            for ingredient in ingredients
+        ]
+        self.add_cached_font(recipes_info + ''.join(ingredients_info))
         self.add_page()
         self.set_font(FONT, '', 10)
         self.set_auto_page_break(auto=1, margin=20)
-        self.multi_cell(0, 10,
-                        f'Список покупок для рецептов '
-                        f'{", ".join(final_ingredients.keys())}.',
-                        ln=1
-                        )
+        self.multi_cell(0, 10, recipes_info, ln=1)
         self.ln()
         self.cell(0, 10,
                   'Вам понадобится:',
                   ln=1
                   )
         self.ln()
-        all_ingredients = []
-        same_ingredients = {}
-        for ingredients_list in final_ingredients.values():
-            all_ingredients.extend(ingredients_list)
-        for ingredient in all_ingredients:
-            ingredient_name = ingredient['ingredient_name']
-            ingredient_quantity = ingredient['ingredient_quantity']
-            measurement_unit = ingredient['measurement_unit']
-            if ingredient_name in same_ingredients:
-                same_ingredients[ingredient_name]['ingredient_quantity'] += \
-                    ingredient_quantity
-            else:
-                same_ingredients[ingredient_name] = {
-                    "ingredient_quantity": ingredient_quantity,
-                    "measurement_unit": measurement_unit
-                }
-        for ingredient_name, ingredient_data in same_ingredients.items():
-            ingredient_info = (
-                f'{ingredient_name} '
-                f'в количестве {ingredient_data["ingredient_quantity"]} '
-                f'{ingredient_data["measurement_unit"]}'
-            )
-            lines = self.cell(0, 10, ingredient_info)
-            if isinstance(lines, list):
-                for line in lines:
-                    self.cell(0, 10, txt=line, ln=True)
-            else:
-                self.cell(0, 10, txt=lines, ln=True)
+        for ingredient_info in ingredients_info:
+            self.cell(0, 10, txt=ingredient_info, ln=True)
         pdf_bytes = BytesIO()
         self.output(pdf_bytes)
         return pdf_bytes.getvalue()
@@ -1,17 +1,23 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, prefetch_related_objects
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import get_user_model
 from rest_framework import generics, status, viewsets, filters
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from recipes.models import (
     Tag,
     Product,
     Favorite,
     Recipe,
-    PurchaseList,
-    IngredientToRecipe
+    PurchaseList
 )
 from users.models import Follow
 from .serializers import (
@@ -19,14 +25,46 @@ from .serializers import (
     IngredientSerializer, PurchaseListSerializer,
     RecipeSerializer, ReturnPurchaseListSerializer,
     SetPasswordSerializer, TagSerializer, UserSerializer,
-    CreateRecipeSerializer
+    CreateRecipeSerializer, ShoppingListIngredientSerializer
 )
-from .utils import JsonToPdf
+from .utils import (
+    create_unique, get_recipes_limit, get_shopping_list, get_subscriptions,
+    shopping_list_to_csv, shopping_list_to_text
+)
+from recipes.versions import INGREDIENTS, TAGS
+from .authentication import invalidate_user_tokens
+from .cache import (
+    cache_anonymous_response, recipe_etag, recipe_last_modified,
+    user_recipe_etag, version_etag, version_last_modified
+)
+from .jobs import (
+    DONE, FAILED, enqueue_pdf, get_job, get_or_render_pdf, read_pdf
+)
+from .pagination import RecipeCursorPagination
 from .permissions import OwnerOrReadOnly
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .search import ingredient_index, search_recipes
+from .transfer import RecipeImporter, export_recipes
 
 
 User = get_user_model()
 
+RECIPE_PREFETCH = ('tags', 'ingredientsincide__product')
+
+SHOPPING_LIST_STREAMS = {
+    'txt': shopping_list_to_text,
+    'csv': shopping_list_to_csv,
+}
+
+tags_condition = condition(
+    etag_func=version_etag(TAGS),
+    last_modified_func=version_last_modified(TAGS)
+)
+ingredients_condition = condition(
+    etag_func=version_etag(INGREDIENTS),
+    last_modified_func=version_last_modified(INGREDIENTS)
+)
+
 
 class UserListCreateView(generics.ListCreateAPIView):
     """Обрабатывает запрос списка и создание нового пользователя."""
@@ -99,12 +137,19 @@ class SetPasswordView(generics.UpdateAPIView):
         )
 
     def perform_update(self, serializer):
-        """Добавляет проверку пароля в метод update."""
+        """
+        Добавляет проверку пароля в метод update.
+        Сохраняется только пароль: пользователь может быть взят
+        из кэша аутентификации и содержать устаревшие поля.
+        """
         user = self.get_object()
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
+        invalidate_user_tokens(user)
 
 
+@method_decorator(tags_condition, name='list')
+@method_decorator(tags_condition, name='retrieve')
 class TagsViewSet(viewsets.ModelViewSet):
     """Возвращает список и отдельный тег."""
 
@@ -120,47 +165,104 @@ class TagsViewSet(viewsets.ModelViewSet):
         return queryset
 
 
+@method_decorator(ingredients_condition, name='retrieve')
 class IngredientViewset(viewsets.ModelViewSet):
     """Возвращает список и отдельный ингредиент."""
 
     queryset = Product.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ['name']
     pagination_class = None
 
+    @method_decorator(ingredients_condition)
+    def list(self, request, *args, **kwargs):
+        """Ищет ингредиенты по индексу в памяти вместо ILIKE."""
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        products = ingredient_index.search(
+            name, limit=settings.INGREDIENT_SEARCH_LIMIT)
+        serializer = self.get_serializer(products, many=True)
+        return Response(serializer.data)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
 
-    queryset = Recipe.objects.prefetch_related(
-        'tags', 'ingredients').select_related('author').all()
     serializer_class = RecipeSerializer
     filter_backends = (filters.OrderingFilter,)
     ordering = ('-pub_date',)
 
+    def get_queryset(self):
+        """
+        Добавляет к рецептам флаги избранного и списка покупок
+        текущего пользователя в виде подзапросов EXISTS.
+        При просмотре рецепта связи подгружаются в retrieve,
+        а к флагам добавляется подписка на автора для ETag.
+        """
+        queryset = Recipe.objects.select_related('author').defer(
+            'search_vector')
+        if self.action != 'retrieve':
+            queryset = queryset.prefetch_related(*RECIPE_PREFETCH)
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                favorited=Exists(Favorite.objects.filter(
+                    author=user, recipe=OuterRef('pk'))),
+                in_shopping_cart=Exists(PurchaseList.objects.filter(
+                    author=user, recipe=OuterRef('pk')))
+            )
+            if self.action == 'retrieve':
+                queryset = queryset.annotate(
+                    subscribed=Exists(Follow.objects.filter(
+                        follower=user, author=OuterRef('author'))))
+        return queryset
+
+    @property
+    def paginator(self):
+        """
+        Включает курсорную пагинацию, если передан параметр cursor.
+        Курсор задает порядок (pub_date, id), поэтому результаты
+        поиска, отсортированные по релевантности, всегда листаются
+        постранично.
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            cursor_param = RecipeCursorPagination.cursor_query_param
+            if cursor_param in params and not params.get('search'):
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH']:
             return CreateRecipeSerializer
         return RecipeSerializer
 
+    @cache_anonymous_response('list')
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        if request.query_params.get('is_favorited'):
-            recipes_pk = Favorite.objects.filter(
-                author=request.user).values_list('recipe_id', flat=True)
-            queryset = queryset.filter(id__in=recipes_pk)
-        if request.query_params.get('is_in_shopping_cart'):
-            recipes_pk = PurchaseList.objects.filter(
-                author=request.user).values_list('recipe_id', flat=True)
-            queryset = queryset.filter(id__in=recipes_pk)
+        if request.user.is_authenticated:
+            if request.query_params.get('is_favorited'):
+                queryset = queryset.filter(favorited=True)
+            if request.query_params.get('is_in_shopping_cart'):
+                queryset = queryset.filter(in_shopping_cart=True)
         if request.query_params.get('tags'):
-            tags = Tag.objects.filter(
-                slug__in=request.query_params.getlist('tags'))
-            queryset = queryset.filter(
-                tags__in=tags).distinct()
+            tags_mask = Tag.get_mask(Tag.objects.filter(
+                slug__in=request.query_params.getlist('tags')))
+            queryset = queryset.alias(
+                matched_tags=F('tags_mask').bitand(tags_mask))
+            if not tags_mask:
+                queryset = queryset.none()
+            elif request.query_params.get('tags_match') == 'all':
+                queryset = queryset.filter(matched_tags=tags_mask)
+            else:
+                queryset = queryset.filter(matched_tags__gt=0)
         if request.query_params.get('author'):
             queryset = queryset.filter(
                 author_id=request.query_params['author'])
+        if request.query_params.get('search'):
+            queryset = search_recipes(
+                queryset, request.query_params['search'])
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -168,30 +270,51 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @method_decorator(condition(
+        etag_func=recipe_etag, last_modified_func=recipe_last_modified))
+    @cache_anonymous_response('retrieve')
+    def retrieve(self, request, *args, **kwargs):
+        """
+        ETag авторизованного пользователя проверяется по рецепту,
+        загруженному одним запросом вместе с флагами. Связи
+        подгружаются, только если нужно отдать тело ответа.
+        """
+        instance = self.get_object()
+        etag = None
+        if request.user.is_authenticated:
+            etag = quote_etag(user_recipe_etag(request, instance))
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                return response
+        prefetch_related_objects([instance], *RECIPE_PREFETCH)
+        response = Response(self.get_serializer(instance).data)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+    def get_written_recipe(self, recipe):
+        """
+        Подгружает связи записанного рецепта для ответа. Связи,
+        которые сериализатор уже положил в кэш, повторно не читаются.
+        """
+        prefetch_related_objects([recipe], *RECIPE_PREFETCH)
+        return recipe
+
     def create(self, request, *args, **kwargs):
-        if Recipe.objects.filter(
-            author=request.user,
-            name=request.data['name']
-        ).exists():
-            return Response(
-                {"error": "Такой рецепт уже существует."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        result = serializer.save()
+        result = self.get_written_recipe(serializer.save())
+        result.favorited = result.in_shopping_cart = False
         return Response(RecipeSerializer(
             result, context={'request': request}).data,
             status=status.HTTP_201_CREATED
         )
 
     def partial_update(self, request, *args, **kwargs):
-        recipe_id = self.kwargs['pk']
-        recipe_to_update = Recipe.objects.get(pk=recipe_id)
         serializer = self.get_serializer(
-            instance=recipe_to_update, data=request.data)
+            instance=self.get_object(), data=request.data)
         serializer.is_valid(raise_exception=True)
-        result = serializer.save()
+        result = self.get_written_recipe(serializer.save())
         return Response(RecipeSerializer(
             result, context={'request': request}).data,
             status=status.HTTP_200_OK
@@ -213,8 +336,10 @@ class FollowListView(generics.ListAPIView,):
     permission_classes = [OwnerOrReadOnly]
 
     def get_queryset(self):
-        current_user = self.request.user
-        return Follow.objects.filter(follower=current_user)
+        return get_subscriptions(
+            self.request.user,
+            get_recipes_limit(self.request)
+        )
 
 
 class FollowRetrieveDeleteView(
@@ -230,23 +355,21 @@ class FollowRetrieveDeleteView(
         """Создает подписку."""
         author_id = self.kwargs['pk']
         author = get_object_or_404(User, pk=author_id)
-        if Follow.objects.filter(
-            author=author,
-            follower=self.request.user
-        ).exists():
-            return Response(
-                {"error": "Пользователь уже подписан"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
         if author == self.request.user:
             return Response(
                 {"error": "Вы не можете подписаться на себя."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        follow_instance = Follow.objects.create(
+        follow_instance = create_unique(
+            Follow,
             author=author,
             follower=self.request.user
         )
+        if follow_instance is None:
+            return Response(
+                {"error": "Пользователь уже подписан"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         serializer = FollowSerializer(
             follow_instance,
             context={'request': request}
@@ -256,18 +379,15 @@ class FollowRetrieveDeleteView(
     def delete(self, request, *args, **kwargs):
         """Удаляет подписку."""
         author_id = self.kwargs['pk']
-        author = get_object_or_404(User, pk=author_id)
-        if Follow.objects.filter(
-            author=author,
+        deleted_count, _ = Follow.objects.filter(
+            author_id=author_id,
             follower=self.request.user
-        ).exists():
-            Follow.objects.filter(
-                author=author,
-                follower=self.request.user
-            ).delete()
+        ).delete()
+        if deleted_count:
             return Response(
                 status=status.HTTP_204_NO_CONTENT
             )
+        get_object_or_404(User, pk=author_id)
         return Response(
             {"message": "Такой подписки не существует."},
             status=status.HTTP_400_BAD_REQUEST
@@ -289,33 +409,31 @@ class FavoriteRetrieveDeleteView(
         """Добавляет рецепт."""
         recipe_id = self.kwargs['pk']
         favorite_recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if Favorite.objects.filter(
-                author=request.user,
-                recipe=favorite_recipe
-        ).exists():
+        new_favorite = create_unique(
+            Favorite,
+            author=request.user,
+            recipe=favorite_recipe
+        )
+        if new_favorite is None:
             return Response(
                 {"message": "Такая запись уже есть."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        new_favorite = Favorite.objects.create(
-            author=request.user,
-            recipe=favorite_recipe
-        )
         serializer = FavoriteSerializer(new_favorite)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, *args, **kwargs):
         """Удаляет рецепт."""
         recipe_id = self.kwargs['pk']
-        recipe_to_delete = Recipe.objects.get(pk=recipe_id)
         deleted_count, _ = Favorite.objects.filter(
             author=request.user,
-            recipe=recipe_to_delete
+            recipe_id=recipe_id
         ).delete()
         if deleted_count:
             return Response(
                 status=status.HTTP_204_NO_CONTENT
             )
+        get_object_or_404(Recipe, pk=recipe_id)
         return Response(
             {"message": "Такой записи не существует."},
             status=status.HTTP_400_BAD_REQUEST
@@ -335,18 +453,16 @@ class ShoppingListRetrieveDeleteView(
         """Добавляет рецепт."""
         recipe_id = self.kwargs['pk']
         favorite_recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if PurchaseList.objects.filter(
-                author=request.user,
-                recipe=favorite_recipe
-        ).exists():
+        new_favorite = create_unique(
+            PurchaseList,
+            author=request.user,
+            recipe=favorite_recipe
+        )
+        if new_favorite is None:
             return Response(
                 {"message": "Такая запись уже есть."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        new_favorite = PurchaseList.objects.create(
-            author=request.user,
-            recipe=favorite_recipe
-        )
         serializer = PurchaseListSerializer(new_favorite)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -361,6 +477,7 @@ class ShoppingListRetrieveDeleteView(
             return Response(
                 status=status.HTTP_204_NO_CONTENT
             )
+        get_object_or_404(Recipe, pk=recipe_to_delete)
         return Response(
             {"message": "Такой записи не существует."},
             status=status.HTTP_400_BAD_REQUEST
@@ -372,37 +489,126 @@ class GetShoppingListView(generics.RetrieveAPIView):
 
     queryset = PurchaseList.objects.all()
     serializer_class = ReturnPurchaseListSerializer
-    permission_classes = [OwnerOrReadOnly]
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (
+        JSONRenderer, PDFRenderer, PlainTextRenderer, CSVRenderer
+    )
 
     def get(self, request):
-        purchases = PurchaseList.objects.filter(author=self.request.user)
-        final_ingredients = {}
-        for purchase in purchases:
-            recipe = purchase.recipe
-            recipe_name = recipe.name
-            ingredients_to_recipe = IngredientToRecipe.objects.filter(
-                recipe=recipe
+        """
+        Отдает список покупок в формате из параметра format.
+        Текстовые форматы отдаются потоково, без сборки PDF,
+        с явной кодировкой: в списке кириллица.
+        """
+        renderer = request.accepted_renderer
+        export_format = renderer.format
+        ingredients = get_shopping_list(request.user)
+        if export_format in SHOPPING_LIST_STREAMS:
+            response = StreamingHttpResponse(
+                SHOPPING_LIST_STREAMS[export_format](ingredients),
+                content_type=f'{renderer.media_type}; '
+                             f'charset={renderer.charset}'
+            )
+        else:
+            export_format = 'pdf'
+            response = HttpResponse(
+                get_or_render_pdf(request.user),
+                content_type='application/pdf'
             )
-            ingredients = []
-            ingredient_data = {}
-            for ingredient_to_recipe in ingredients_to_recipe:
-                ingredient = ingredient_to_recipe.product
-                ingredient_name = ingredient.name
-                ingredient_quantity = ingredient_to_recipe.amount
-                measurement_unit = ingredient.measurement_unit
-                if ingredient_name in ingredient_data:
-                    ingredient_data[
-                        'ingredient_quantity'] += ingredient_quantity
-                else:
-                    ingredient_data = {
-                        'ingredient_name': ingredient_name,
-                        'ingredient_quantity': ingredient_quantity,
-                        'measurement_unit': measurement_unit,
-                    }
-                ingredients.append(ingredient_data)
-            final_ingredients[recipe_name] = ingredients
-        pdf_converter = JsonToPdf()
-        pdf_bytes = pdf_converter.json_transformer(final_ingredients)
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="recipe.pdf"'
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipe.{export_format}"'
+        )
         return response
+
+
+class ShoppingListJobCreateView(generics.GenericAPIView):
+    """Ставит генерацию PDF со списком покупок в очередь."""
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        job = enqueue_pdf(request.user)
+        status_code = (
+            status.HTTP_201_CREATED
+            if job.status == DONE
+            else status.HTTP_202_ACCEPTED
+        )
+        return Response(
+            {'id': job.content_hash, 'status': job.status},
+            status=status_code
+        )
+
+
+class ShoppingListJobDetailView(generics.GenericAPIView):
+    """
+    Возвращает статус генерации PDF.
+    Готовый файл отдается только владельцу задачи.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, job_id):
+        job = get_job(request.user, job_id)
+        pdf_bytes = read_pdf(job) if job is not None else None
+        if pdf_bytes is not None:
+            response = HttpResponse(pdf_bytes, content_type='application/pdf')
+            response['Content-Disposition'] = (
+                'attachment; filename="recipe.pdf"'
+            )
+            return response
+        if job is None or job.status == DONE:
+            return Response(
+                {"message": "Такой задачи не существует."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        status_code = (
+            status.HTTP_500_INTERNAL_SERVER_ERROR
+            if job.status == FAILED
+            else status.HTTP_202_ACCEPTED
+        )
+        return Response(
+            {'id': job.content_hash, 'status': job.status},
+            status=status_code
+        )
+
+
+class ShoppingListPreviewView(generics.ListAPIView):
+    """Возвращает суммированный список покупок в формате JSON."""
+
+    serializer_class = ShoppingListIngredientSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = None
+
+    def get_queryset(self):
+        return get_shopping_list(self.request.user)
+
+
+class RecipeExportView(generics.GenericAPIView):
+    """
+    Потоково выгружает все рецепты в NDJSON, по рецепту на строку.
+    С параметром images=inline изображения встраиваются в base64.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        response = StreamingHttpResponse(
+            export_recipes(request.query_params.get('images') == 'inline'),
+            content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"'
+        )
+        return response
+
+
+class RecipeImportView(generics.GenericAPIView):
+    """
+    Импортирует рецепты из NDJSON в теле запроса.
+    Возвращает число созданных рецептов и ошибки по номерам строк.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request):
+        return Response(RecipeImporter().run(request.stream or []))
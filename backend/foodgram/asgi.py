@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings_asgi')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """
+    Выделяет каждому запросу свой поток для thread-sensitive кода.
+    Django 3.2 без этого выполняет синхронный код всех запросов,
+    включая ORM, в одном общем потоке.
+    """
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
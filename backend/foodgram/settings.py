@@ -57,7 +57,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -66,6 +66,8 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -113,6 +115,42 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: хосты через запятую в DB_REPLICA_HOSTS.
+DB_REPLICA_HOSTS = [
+    host.strip()
+    for host in os.getenv('DB_REPLICA_HOSTS', default='').split(',')
+    if host.strip()
+]
+DATABASE_REPLICAS = []
+for number, host in enumerate(DB_REPLICA_HOSTS, start=1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+RECIPES_CACHE_TIMEOUT = int(os.getenv('RECIPES_CACHE_TIMEOUT', default=300))
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60))
+
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
@@ -161,3 +199,44 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 DJOSER = {'LOGIN_FIELD': 'email', }
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', default=50))
+
+SHOPPING_LIST_PDF_WORKERS = int(
+    os.getenv('SHOPPING_LIST_PDF_WORKERS', default=2)
+)
+# Готовые PDF со списками покупок хранятся вне MEDIA_ROOT
+# и отдаются только через API.
+SHOPPING_LIST_PDF_ROOT = os.getenv(
+    'SHOPPING_LIST_PDF_ROOT',
+    default=os.path.join(BASE_DIR, 'private/shopping_lists/')
+)
+
+# Request metrics
+
+SERVER_TIMING_HEADER = (
+    os.getenv('SERVER_TIMING_HEADER', default='True') == 'True'
+)
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', default=500))
+SLOW_REQUEST_QUERIES = int(os.getenv('SLOW_REQUEST_QUERIES', default=30))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('METRICS_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', default=1600))
+RECIPE_IMAGE_QUALITY = int(os.getenv('RECIPE_IMAGE_QUALITY', default=85))
+IMAGE_RENDITION_WORKERS = int(
+    os.getenv('IMAGE_RENDITION_WORKERS', default=2)
+)
@@ -0,0 +1,15 @@
+"""
+Настройки для запуска под ASGI-сервером. Режим необязательный:
+по умолчанию проект работает под WSGI, который быстрее, пока
+запросы не ждут БД подолгу. ASGI имеет смысл при удаленной БД
+с заметной задержкой, см. README и bench_asgi.
+Горячие эндпоинты чтения обслуживаются асинхронными представлениями
+api.async_urls, остальные маршруты совпадают с WSGI.
+Постоянные соединения с БД (CONN_MAX_AGE) здесь включать нельзя:
+каждый запрос работает с БД в собственном потоке.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'foodgram.urls_asgi'
+DATABASES['default']['CONN_MAX_AGE'] = 0  # noqa: F405
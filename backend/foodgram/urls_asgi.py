@@ -0,0 +1,8 @@
+from django.urls import include, path
+
+from .urls import handler404, urlpatterns as sync_urlpatterns  # noqa: F401
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+    *sync_urlpatterns
+]
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from .carts import change_recipe_carts
 from .models import (Tag, Product, Recipe,
                      IngredientToRecipe, PurchaseList,
                      Favorite)
@@ -10,18 +11,26 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'author',
-        # 'get_recipe_favorites_count',
+        'favorites_count',
+        'in_carts_count',
     )
     list_filter = (
         'author',
         'name',
         'tags'
     )
-    # actions = ()
+    list_select_related = ('author',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
-    # def get_recipe_favorites_count(self, obj):
-    #     return obj.is_favorited.count()
-    # get_recipe_favorites_count.short_description = 'Добавлено в избранное'
+    def save_model(self, request, obj, form, change):
+        """
+        Изменение сохраняет только CONTENT_FIELDS, чтобы не затереть
+        счетчики и renditions_for, измененные после загрузки формы.
+        """
+        if change:
+            obj.save(update_fields=Recipe.CONTENT_FIELDS)
+        else:
+            super().save_model(request, obj, form, change)
 
 
 @admin.register(Product)
@@ -39,7 +48,31 @@ class ProductAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(IngredientToRecipe)
+class IngredientToRecipeAdmin(admin.ModelAdmin):
+    """
+    Ингредиенты рецептов. Изменения переносятся в суммы
+    списков покупок, в которых есть рецепт.
+    """
+    list_select_related = ('recipe', 'product')
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = IngredientToRecipe.objects.get(pk=obj.pk)
+            change_recipe_carts(old.recipe_id, {old.product_id: -old.amount})
+        super().save_model(request, obj, form, change)
+        change_recipe_carts(obj.recipe_id, {obj.product_id: obj.amount})
+
+    def delete_model(self, request, obj):
+        change_recipe_carts(obj.recipe_id, {obj.product_id: -obj.amount})
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            change_recipe_carts(obj.recipe_id, {obj.product_id: -obj.amount})
+        super().delete_queryset(request, queryset)
+
+
 admin.site.register(Tag)
-admin.site.register(IngredientToRecipe)
 admin.site.register(PurchaseList)
 admin.site.register(Favorite)
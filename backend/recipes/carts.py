@@ -0,0 +1,85 @@
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import CartItem, IngredientToRecipe, PurchaseList
+
+
+def get_recipe_amounts(recipe_id):
+    """Возвращает количество каждого продукта в рецепте."""
+    return dict(IngredientToRecipe.objects.filter(
+        recipe_id=recipe_id
+    ).order_by().values('product').annotate(
+        total=Sum('amount')
+    ).values_list('product', 'total'))
+
+
+def change_cart_items(user_ids, deltas):
+    """
+    Прибавляет к суммам продуктов в списках покупок пользователей
+    изменения deltas вида {id продукта: изменение количества}.
+    Не больше трех запросов при любом числе пользователей и продуктов:
+    недостающие строки создаются пачкой, суммы меняются одним UPDATE,
+    обнулившиеся строки удаляются. Сумма не опускается ниже нуля,
+    даже если строка разошлась со списком покупок: иначе UPDATE
+    нарушит ограничение CHECK положительного поля.
+    """
+    deltas = {product: delta for product, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    CartItem.objects.bulk_create(
+        [
+            CartItem(user_id=user_id, product_id=product_id)
+            for user_id in user_ids
+            for product_id, delta in deltas.items() if delta > 0
+        ],
+        ignore_conflicts=True
+    )
+    items = CartItem.objects.filter(user__in=user_ids, product__in=deltas)
+    items.update(total_amount=Greatest(
+        F('total_amount') + Case(
+            *[
+                When(product_id=product_id, then=Value(delta))
+                for product_id, delta in deltas.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField()
+        ),
+        Value(0)
+    ))
+    if any(delta < 0 for delta in deltas.values()):
+        items.filter(total_amount=0).delete()
+
+
+def change_recipe_in_cart(user_id, recipe_id, sign):
+    change_cart_items([user_id], {
+        product: sign * amount
+        for product, amount in get_recipe_amounts(recipe_id).items()
+    })
+
+
+def add_recipe_to_cart(user_id, recipe_id):
+    change_recipe_in_cart(user_id, recipe_id, 1)
+
+
+def remove_recipe_from_cart(user_id, recipe_id):
+    change_recipe_in_cart(user_id, recipe_id, -1)
+
+
+def change_recipe_carts(recipe_id, deltas):
+    """Переносит изменение ингредиентов рецепта во все списки с ним."""
+    if not any(deltas.values()):
+        return
+    change_cart_items(
+        list(PurchaseList.objects.filter(
+            recipe_id=recipe_id).values_list('author_id', flat=True)),
+        deltas
+    )
+
+
+def get_actual_cart_items():
+    """Суммы продуктов, посчитанные заново по спискам покупок."""
+    return IngredientToRecipe.objects.filter(
+        recipe__is_in_shopping_cart__isnull=False
+    ).order_by().values(
+        'product', user=F('recipe__is_in_shopping_cart__author')
+    ).annotate(total=Sum('amount'))
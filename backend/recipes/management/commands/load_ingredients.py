@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Product
+from recipes.versions import INGREDIENTS, bump_version
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'ingredients.json'
+)
+CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Построчно читает CSV вида 'наименование,единица измерения'."""
+    for row in csv.reader(file):
+        if len(row) < 2:
+            continue
+        yield row[0], row[1]
+
+
+def read_json(file):
+    """
+    Потоково читает JSON-массив объектов с полями name и measurement_unit,
+    не загружая весь файл в память.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив продуктов.')
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if buffer.startswith(']', position):
+            return
+        try:
+            product, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Файл JSON обрывается.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield product['name'], product['measurement_unit']
+
+
+def batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_with_copy(batch):
+    """Загружает пачку через COPY во временную таблицу и INSERT ON CONFLICT."""
+    table = Product._meta.db_table
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE product_import '
+            '(name varchar(255), measurement_unit varchar(255)) '
+            'ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            'COPY product_import (name, measurement_unit) FROM STDIN '
+            'WITH CSV',
+            buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT DISTINCT name, measurement_unit FROM product_import '
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'
+        )
+
+
+def insert_with_bulk_create(batch):
+    Product.objects.bulk_create(
+        [
+            Product(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in batch
+        ],
+        ignore_conflicts=True
+    )
+
+
+class Command(BaseCommand):
+    """
+    Загружает каталог продуктов из CSV или JSON.
+    Повторный запуск не создает дубликатов: уже существующие пары
+    (наименование, единица измерения) пропускаются на уровне БД.
+    """
+
+    help = 'Загружает ингредиенты из CSV или JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        extension = os.path.splitext(path)[1].lower()
+        readers = {'.csv': read_csv, '.json': read_json}
+        if extension not in readers:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        insert = insert_with_bulk_create
+        if connection.vendor == 'postgresql' and not options['no_copy']:
+            insert = insert_with_copy
+        products_before = Product.objects.count()
+        rows_count = 0
+        started = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            for batch in batches(readers[extension](file),
+                                 options['batch_size']):
+                insert(batch)
+                rows_count += len(batch)
+        elapsed = time.perf_counter() - started
+        bump_version(INGREDIENTS)
+        created = Product.objects.count() - products_before
+        rate = rows_count / max(elapsed, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {rows_count}, добавлено продуктов: {created} '
+            f'за {elapsed:.2f} с ({rate:.0f} строк/с).'
+        ))
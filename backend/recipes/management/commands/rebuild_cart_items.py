@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.carts import get_actual_cart_items
+from recipes.models import CartItem
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    """
+    Сверяет CartItem с суммами, посчитанными заново по спискам покупок,
+    и пересобирает таблицу с нуля. С --check только выводит число
+    расхождений и завершается ошибкой, если они есть.
+    """
+
+    help = 'Проверяет и пересобирает суммы продуктов в списках покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, не изменяя данные.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            actual = {
+                (item['user'], item['product']): item['total']
+                for item in get_actual_cart_items().iterator()
+            }
+            stored = {
+                (user_id, product_id): total_amount
+                for user_id, product_id, total_amount
+                in CartItem.objects.order_by().values_list(
+                    'user_id', 'product_id', 'total_amount').iterator()
+            }
+            mismatched = sum(
+                actual.get(key) != stored.get(key)
+                for key in actual.keys() | stored.keys()
+            )
+            if options['check']:
+                if mismatched:
+                    raise CommandError(f'Расхождений: {mismatched}.')
+                self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+                return
+            CartItem.objects.all().delete()
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(
+                        user_id=user_id,
+                        product_id=product_id,
+                        total_amount=total
+                    )
+                    for (user_id, product_id), total in actual.items()
+                ],
+                batch_size=BATCH_SIZE
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено расхождений: {mismatched}, строк: {len(actual)}.'))
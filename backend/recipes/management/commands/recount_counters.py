@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, PurchaseList, Recipe
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', PurchaseList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+def count_related(model, field):
+    """Подзапрос с количеством связанных строк для каждой строки."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает денормализованные счетчики рецептов и пользователей.
+    Каждый счетчик исправляется одним UPDATE, который затрагивает
+    только строки с расхождением.
+    """
+
+    help = 'Пересчитывает счетчики избранного, покупок и рецептов.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, field, related_model, related_field in COUNTERS:
+                actual = count_related(related_model, related_field)
+                fixed = model.objects.exclude(**{field: actual}).update(
+                    **{field: actual})
+                self.stdout.write(
+                    f'{model._meta.model_name}.{field}: исправлено {fixed}')
@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_products(apps, schema_editor):
+    """Оставляет один продукт на пару (наименование, единица измерения)."""
+    Product = apps.get_model('recipes', 'Product')
+    IngredientToRecipe = apps.get_model('recipes', 'IngredientToRecipe')
+    duplicates = Product.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates:
+        extra = Product.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(id=duplicate['keep_id'])
+        IngredientToRecipe.objects.filter(
+            product__in=extra
+        ).update(product_id=duplicate['keep_id'])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_alter_recipe_cooking_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_products, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:26
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_merge_duplicate_products'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='product',
+            unique_together={('name', 'measurement_unit')},
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import Min
+
+
+def remove_duplicate_purchases(apps, schema_editor):
+    """Удаляет повторяющиеся записи перед добавлением уникальности."""
+    PurchaseList = apps.get_model('recipes', 'PurchaseList')
+    keep_ids = PurchaseList.objects.values(
+        'author', 'recipe'
+    ).annotate(keep_id=Min('id')).values('keep_id')
+    PurchaseList.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_purchases, migrations.RunPython.noop
+        ),
+    ]
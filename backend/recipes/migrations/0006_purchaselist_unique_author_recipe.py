@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:28
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0005_remove_duplicate_purchases'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='purchaselist',
+            unique_together={('author', 'recipe')},
+        ),
+    ]
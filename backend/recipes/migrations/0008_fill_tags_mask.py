@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def fill_tags_mask(apps, schema_editor):
+    """Назначает биты существующим тегам и считает маски рецептов."""
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    bits = {}
+    for bit, tag in enumerate(Tag.objects.order_by('id')):
+        tag.bit = bit
+        tag.save(update_fields=['bit'])
+        bits[tag.id] = bit
+    masks = {}
+    for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag_id'
+    ):
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << bits[tag_id]
+    for recipe_id, mask in masks.items():
+        Recipe.objects.filter(id=recipe_id).update(tags_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_tag_bit_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_alter_tag_bit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='renditions_for',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Изображение, для которого готовы уменьшенные копии'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счетчики по существующим рецептам, избранному и покупкам."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    PurchaseList = apps.get_model('recipes', 'PurchaseList')
+    User = apps.get_model('users', 'CustomUser')
+    Recipe.objects.update(
+        favorites_count=count_related(Favorite, 'recipe'),
+        in_carts_count=count_related(PurchaseList, 'recipe')
+    )
+    User.objects.update(recipes_count=count_related(Recipe, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_counters'),
+        ('users', '0005_customuser_recipes_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
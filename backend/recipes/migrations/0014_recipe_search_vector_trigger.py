@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# Вектор строится триггером, поэтому он актуален и после bulk_create
+# и UPDATE в обход моделей. Название весит больше описания.
+CREATE_TRIGGER = '''
+CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.russian',
+                              coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.russian',
+                              coalesce(NEW.text, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_search_vector_trigger
+BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update();
+
+UPDATE recipes_recipe SET name = name;
+
+CREATE INDEX recipe_search_vector_idx ON recipes_recipe
+USING gin (search_vector);
+'''
+
+DROP_TRIGGER = '''
+DROP INDEX IF EXISTS recipe_search_vector_idx;
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger ON recipes_recipe;
+DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update();
+'''
+
+
+def run_on_postgresql(sql):
+    """На других СУБД поиск работает по индексу в памяти процесса."""
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgresql(CREATE_TRIGGER),
+            run_on_postgresql(DROP_TRIGGER)
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.models import F, Sum
+
+
+def fill_cart_items(apps, schema_editor):
+    """Заполняет суммы продуктов по существующим спискам покупок."""
+    IngredientToRecipe = apps.get_model('recipes', 'IngredientToRecipe')
+    CartItem = apps.get_model('recipes', 'CartItem')
+    items = IngredientToRecipe.objects.filter(
+        recipe__is_in_shopping_cart__isnull=False
+    ).order_by().values(
+        'product', user=F('recipe__is_in_shopping_cart__author')
+    ).annotate(total=Sum('amount'))
+    CartItem.objects.bulk_create(
+        [
+            CartItem(
+                user_id=item['user'],
+                product_id=item['product'],
+                total_amount=item['total']
+            )
+            for item in items.iterator()
+        ],
+        batch_size=5000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_cartitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_cart_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0016_fill_cart_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='Хеш содержимого корзины')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Статус')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'PDF со списком покупок',
+                'verbose_name_plural': 'PDF со списками покупок',
+                'ordering': ['-created'],
+                'unique_together': {('user', 'content_hash')},
+            },
+        ),
+    ]
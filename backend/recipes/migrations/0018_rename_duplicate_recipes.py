@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+NAME_MAX_LENGTH = 26
+
+
+def rename_duplicate_recipes(apps, schema_editor):
+    """
+    Переименовывает повторяющиеся рецепты автора перед добавлением
+    уникальности. Рецепты не удаляются, чтобы не потерять избранное
+    и списки покупок: к имени добавляется id рецепта.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    duplicates = Recipe.objects.values(
+        'author', 'name'
+    ).annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1).order_by()
+    for duplicate in duplicates:
+        extra = Recipe.objects.filter(
+            author=duplicate['author'], name=duplicate['name']
+        ).exclude(id=duplicate['keep_id'])
+        for recipe in extra:
+            suffix = f' #{recipe.id}'
+            recipe.name = (
+                recipe.name[:NAME_MAX_LENGTH - len(suffix)] + suffix)
+            recipe.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_shoppinglistjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            rename_duplicate_recipes, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:37
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0018_rename_duplicate_recipes'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='recipe',
+            unique_together={('author', 'name')},
+        ),
+    ]
@@ -1,11 +1,18 @@
+from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from autoslug import AutoSlugField
 from colorfield.fields import ColorField
 
 User = get_user_model()
 
+# Маска хранится в BigIntegerField, старший бит не используется,
+# чтобы маска оставалась положительной.
+TAGS_MASK_SIZE = 63
+TAGS_LIMIT = f'Допускается не более {TAGS_MASK_SIZE} тегов.'
+
 
 class Tag(models.Model):
     """Модель тега для поиска рецептов."""
@@ -26,6 +33,8 @@ class Tag(models.Model):
                        verbose_name='Цвет тега')
     slug = AutoSlugField(populate_from='name', unique=True,
                          verbose_name='Слаг тега')
+    bit = models.PositiveSmallIntegerField(unique=True, editable=False,
+                                           verbose_name='Бит в маске тегов')
 
     class Meta:
         verbose_name = 'Тег'
@@ -36,6 +45,40 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_free_bit(cls):
+        """Возвращает первый свободный бит маски или None."""
+        used_bits = set(cls.objects.values_list('bit', flat=True))
+        return next(
+            (bit for bit in range(TAGS_MASK_SIZE) if bit not in used_bits),
+            None
+        )
+
+    def clean(self):
+        """Новый тег нельзя создать, если все биты маски заняты."""
+        if self.bit is None and Tag.get_free_bit() is None:
+            raise ValidationError(TAGS_LIMIT)
+
+    def save(self, *args, **kwargs):
+        """
+        Назначает тегу первый свободный бит в маске тегов рецепта.
+        Лимит проверяется заранее в clean() и сериализаторах,
+        здесь он только защищает маску от переполнения.
+        """
+        if self.bit is None:
+            self.bit = Tag.get_free_bit()
+            if self.bit is None:
+                raise ValidationError(TAGS_LIMIT)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def get_mask(cls, tags):
+        """Возвращает битовую маску для набора тегов."""
+        mask = 0
+        for bit in tags.values_list('bit', flat=True):
+            mask |= 1 << bit
+        return mask
+
 
 class Product(models.Model):
     """
@@ -52,6 +95,7 @@ class Product(models.Model):
         ordering = ['name']
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        unique_together = ['name', 'measurement_unit']
 
     def __str__(self):
         return self.name
@@ -60,6 +104,11 @@ class Product(models.Model):
 class Recipe(models.Model):
     """Модель отдельно взятого рецепта."""
 
+    # Поля, которые правят автор и админка. Счетчики, маска тегов
+    # и renditions_for меняются отдельными UPDATE, поэтому при
+    # сохранении рецепта их перезаписывать нельзя.
+    CONTENT_FIELDS = ('author', 'name', 'image', 'text', 'cooking_time')
+
     tags = models.ManyToManyField(Tag, verbose_name='Теги')
     author = models.ForeignKey(User, related_name='recipes',
                                on_delete=models.CASCADE, verbose_name='Автор')
@@ -78,15 +127,42 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
+    tags_mask = models.BigIntegerField(default=0, editable=False,
+                                       verbose_name='Битовая маска тегов')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Добавлено в избранное')
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Добавлено в списки покупок')
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    renditions_for = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Изображение, для которого готовы уменьшенные копии'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        unique_together = ['author', 'name']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def update_tags_mask(self):
+        """Пересчитывает денормализованную маску тегов рецепта."""
+        self.tags_mask = Tag.get_mask(self.tags.all())
+        Recipe.objects.filter(pk=self.pk).update(tags_mask=self.tags_mask)
+
 
 class IngredientToRecipe(models.Model):
     """
@@ -126,6 +202,7 @@ class PurchaseList(models.Model):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
         ordering = ['recipe']
+        unique_together = [['author', 'recipe']]
 
     def __str__(self):
         return self.recipe.name
@@ -151,3 +228,69 @@ class Favorite(models.Model):
 
     def __str__(self):
         return self.author.username
+
+
+class CartItem(models.Model):
+    """
+    Сумма продукта по всем рецептам из списка покупок пользователя.
+    Поддерживается при добавлении и удалении рецептов из списка
+    и при изменении ингредиентов рецепта, пересобирается командой
+    rebuild_cart_items.
+    """
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             verbose_name='Пользователь',
+                             related_name='cart_items')
+    product = models.ForeignKey(Product,
+                                on_delete=models.CASCADE,
+                                verbose_name='Продукт',
+                                related_name='cart_items')
+    total_amount = models.PositiveIntegerField(
+        default=0, verbose_name='Общее количество')
+
+    class Meta:
+        verbose_name = 'Продукт в списке покупок'
+        verbose_name_plural = 'Продукты в списках покупок'
+        ordering = ['user']
+        unique_together = [['user', 'product']]
+
+    def __str__(self):
+        return self.product.name
+
+
+class ShoppingListJob(models.Model):
+    """
+    Формирование PDF со списком покупок пользователя.
+    content_hash — хеш содержимого корзины, под ним же сохраняется файл,
+    поэтому готовый PDF не устаревает, пока корзина не изменилась.
+    """
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'В очереди'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             verbose_name='Пользователь',
+                             related_name='shopping_list_jobs')
+    content_hash = models.CharField(max_length=64,
+                                    verbose_name='Хеш содержимого корзины')
+    status = models.CharField(max_length=16, choices=STATUSES,
+                              default=PENDING, verbose_name='Статус')
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='Дата создания')
+
+    class Meta:
+        verbose_name = 'PDF со списком покупок'
+        verbose_name_plural = 'PDF со списками покупок'
+        ordering = ['-created']
+        unique_together = [['user', 'content_hash']]
+
+    def __str__(self):
+        return self.content_hash
@@ -0,0 +1,97 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from .carts import add_recipe_to_cart, remove_recipe_from_cart
+from .models import Favorite, PurchaseList, Recipe, Tag
+
+User = get_user_model()
+
+
+def clear_tag_bit(tag, keep_tagged=False):
+    """Снимает бит тега с рецептов, у которых этого тега больше нет."""
+    bit = 1 << tag.bit
+    recipes = Recipe.objects.annotate(
+        tag_bit=F('tags_mask').bitand(bit)
+    ).filter(tag_bit=bit)
+    if keep_tagged:
+        recipes = recipes.exclude(tags=tag)
+    Recipe.objects.filter(
+        pk__in=recipes.values('pk')
+    ).update(tags_mask=F('tags_mask').bitand(~bit))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tags_mask(instance, action, reverse, pk_set, **kwargs):
+    """Поддерживает маску тегов рецепта при изменении связи с тегами."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        instance.update_tags_mask()
+    elif action == 'post_add':
+        Recipe.objects.filter(pk__in=pk_set).update(
+            tags_mask=F('tags_mask').bitor(1 << instance.bit))
+    else:
+        clear_tag_bit(instance, keep_tagged=True)
+
+
+@receiver(post_delete, sender=Tag)
+def clear_deleted_tag_bit(instance, **kwargs):
+    """Освобождает бит удаленного тега во всех рецептах."""
+    clear_tag_bit(instance)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счетчик в строке БД без чтения текущего значения."""
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=PurchaseList)
+def increment_in_carts_count(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', 1)
+
+
+@receiver(post_delete, sender=PurchaseList)
+def decrement_in_carts_count(instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'in_carts_count', -1)
+
+
+@receiver(post_save, sender=PurchaseList)
+def add_cart_items(instance, created, **kwargs):
+    if created:
+        add_recipe_to_cart(instance.author_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=PurchaseList)
+def remove_cart_items(instance, **kwargs):
+    """
+    Срабатывает до удаления: при удалении рецепта его ингредиенты
+    удаляются той же операцией, и после нее их уже не прочитать.
+    """
+    remove_recipe_from_cart(instance.author_id, instance.recipe_id)
@@ -0,0 +1,146 @@
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from .admin import RecipeAdmin
+from .carts import change_recipe_carts, get_actual_cart_items
+from .models import (
+    TAGS_LIMIT, TAGS_MASK_SIZE, CartItem, Favorite, IngredientToRecipe,
+    Product, PurchaseList, Recipe, Tag
+)
+
+User = get_user_model()
+
+
+def fill_tags():
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {bit}', color='#FF0000', slug=f'tag-{bit}', bit=bit)
+        for bit in range(TAGS_MASK_SIZE)
+    )
+
+
+class TagAdminTest(TestCase):
+    """Лимит тегов в админке выводится ошибкой формы, а не 500."""
+
+    def setUp(self):
+        admin = User.objects.create_superuser(
+            'admin', 'password', 'admin@example.com')
+        self.client.force_login(admin)
+
+    def add_tag(self):
+        return self.client.post(
+            reverse('admin:recipes_tag_add'),
+            {'name': 'Новый', 'color': '#00FF00'}
+        )
+
+    def test_add_tag(self):
+        response = self.add_tag()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Tag.objects.get().bit, 0)
+
+    def test_tags_limit(self):
+        fill_tags()
+        response = self.add_tag()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, TAGS_LIMIT)
+        self.assertEqual(Tag.objects.count(), TAGS_MASK_SIZE)
+
+
+class CartItemsTest(TestCase):
+    """Суммы CartItem совпадают с суммами, посчитанными заново."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                f'user{number}', 'password', f'user{number}@example.com',
+                'Имя', 'Фамилия')
+            for number in range(2)
+        ]
+        Product.objects.bulk_create(
+            Product(name=f'Продукт {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        self.products = list(Product.objects.order_by('pk'))
+        self.recipes = [
+            self.create_recipe(f'Рецепт {number}', amounts)
+            for number, amounts in enumerate([(100, 50, 0), (30, 0, 20)])
+        ]
+
+    def create_recipe(self, name, amounts):
+        recipe = Recipe.objects.create(
+            author=self.users[0], name=name, text='Описание',
+            cooking_time=10, image='recipes/images/test.jpg')
+        IngredientToRecipe.objects.bulk_create(
+            IngredientToRecipe(recipe=recipe, product=product, amount=amount)
+            for product, amount in zip(self.products, amounts) if amount
+        )
+        return recipe
+
+    def assert_consistent(self):
+        self.assertEqual(
+            {
+                (item.user_id, item.product_id): item.total_amount
+                for item in CartItem.objects.all()
+            },
+            {
+                (item['user'], item['product']): item['total']
+                for item in get_actual_cart_items()
+            }
+        )
+
+    def edit_ingredient(self, recipe, product, amount):
+        """Меняет количество так же, как сериализатор рецепта."""
+        ingredient = IngredientToRecipe.objects.filter(
+            recipe=recipe, product=product).first()
+        delta = amount - (ingredient.amount if ingredient else 0)
+        if ingredient is None:
+            IngredientToRecipe.objects.create(
+                recipe=recipe, product=product, amount=amount)
+        elif amount:
+            ingredient.amount = amount
+            ingredient.save()
+        else:
+            ingredient.delete()
+        change_recipe_carts(recipe.pk, {product.pk: delta})
+
+    def test_add_remove_and_edit(self):
+        for user in self.users:
+            for recipe in self.recipes:
+                PurchaseList.objects.create(author=user, recipe=recipe)
+        self.assert_consistent()
+        self.edit_ingredient(self.recipes[0], self.products[0], 10)
+        self.edit_ingredient(self.recipes[0], self.products[2], 5)
+        self.edit_ingredient(self.recipes[1], self.products[2], 0)
+        self.assert_consistent()
+        PurchaseList.objects.get(
+            author=self.users[0], recipe=self.recipes[0]).delete()
+        self.assert_consistent()
+        PurchaseList.objects.filter(author=self.users[1]).delete()
+        self.assert_consistent()
+        self.assertFalse(CartItem.objects.filter(total_amount=0).exists())
+
+    def test_drifted_row_is_clamped(self):
+        PurchaseList.objects.create(
+            author=self.users[0], recipe=self.recipes[0])
+        CartItem.objects.filter(product=self.products[0]).update(
+            total_amount=10)
+        PurchaseList.objects.get(author=self.users[0]).delete()
+        self.assertFalse(CartItem.objects.exists())
+
+
+class RecipeAdminTest(TestCase):
+    """Сохранение рецепта в админке не затирает счетчики."""
+
+    def test_counters_kept(self):
+        author = User.objects.create_user(
+            'author', 'password', 'author@example.com', 'Имя', 'Фамилия')
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10,
+            image='recipes/images/test.jpg')
+        Favorite.objects.create(author=author, recipe=recipe)
+        recipe.name = 'Новое имя'
+        RecipeAdmin(Recipe, site).save_model(None, recipe, None, True)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое имя')
+        self.assertEqual(recipe.favorites_count, 1)
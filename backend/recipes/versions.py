@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{}'
+
+RECIPES = 'recipes'
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+
+
+def get_version(name):
+    """
+    Возвращает версию данных модели: время последнего изменения
+    в наносекундах. Версия хранится в общем кэше, поэтому видна
+    всем процессам, которые используют этот кэш.
+    """
+    return cache.get_or_set(VERSION_KEY.format(name), time.time_ns, None)
+
+
+def set_versions(names):
+    """Сразу записывает новые версии в кэш."""
+    version = time.time_ns()
+    cache.set_many(
+        {VERSION_KEY.format(name): version for name in names}, None)
+
+
+def bump_version(*names):
+    """
+    Обновляет версии после фиксации текущей транзакции. Если обновить
+    их раньше, параллельный запрос может прочитать еще старые данные
+    и закэшировать их под новой версией. Вне транзакции версии
+    обновляются сразу.
+    """
+    transaction.on_commit(lambda: set_versions(names))
@@ -11,6 +11,7 @@ class CustomUserAdmin(UserAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
     )
     list_filter = (
         'email',
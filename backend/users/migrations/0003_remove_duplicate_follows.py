@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    """Удаляет повторяющиеся записи перед добавлением уникальности."""
+    Follow = apps.get_model('users', 'Follow')
+    keep_ids = Follow.objects.values(
+        'follower', 'author'
+    ).annotate(keep_id=Min('id')).values('keep_id')
+    Follow.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_customuser_managers'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_remove_duplicate_follows'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('follower', 'author')},
+        ),
+    ]
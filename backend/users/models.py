@@ -24,6 +24,11 @@ class CustomUser(AbstractUser):
         verbose_name='Фамилия пользователя',
         max_length=150,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
     objects = CustomUserManager()
@@ -54,6 +59,7 @@ class Follow(models.Model):
         ordering = ['author']
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        unique_together = [['follower', 'author']]
 
     def __str__(self):
         return f"{self.follower.username} - подписчик {self.author.username}"